@@ -0,0 +1,69 @@
+import math
+import time
+
+AI_BUDGET_MS = 2.0  # время на решения врагов за кадр, мс
+AI_FAR_TILES = 24  # дальше этого (в тайлах от игрока) враг за экраном считается далёким
+# Раз во сколько кадров принимает решение враг: на экране, за экраном рядом, за экраном далеко
+AI_TIER_INTERVALS = (1, 3, 8)
+AI_VIEW_MARGIN_TILES = 2  # запас вокруг экрана, чтобы враг не «оживал» на самом краю
+
+class AIScheduler:
+    """
+    Runs the enemies' decisions (Enemy.think) within a per-frame time budget.
+    Enemies on screen decide every frame, off-screen ones every AI_TIER_INTERVALS[tier] frames;
+    due decisions are taken nearest tier and longest waiting first until budget_ms is spent
+    (at least one per frame), the rest wait for the next frame. Movement (Enemy.move) runs every frame
+    for every enemy along its last decision, so rarely deciding enemies still move smoothly.
+    The stats of the last frame are in used_ms, decided, deferred; peak_ms is the worst frame so far.
+    """
+    def __init__(self, budget_ms=AI_BUDGET_MS):
+        self.budget_ms = budget_ms
+        self.frame = 0
+        self.last_decision = {}  # враг -> кадр последнего решения
+        self.used_ms = 0.0
+        self.peak_ms = 0.0
+        self.decided = 0
+        self.deferred = 0
+
+    def get_tier(self, enemy, view_rect, player_center):
+        """0 — on screen, 1 — off screen within AI_FAR_TILES of the player, 2 — farther."""
+        if view_rect.colliderect(enemy.get_hitbox()):
+            return 0
+        px, py = player_center
+        tiles = math.hypot(enemy.x - px, enemy.y - py) / max(enemy.tile_width, enemy.tile_height)
+        return 1 if tiles <= AI_FAR_TILES else 2
+
+    def update(self, enemies, view_rect, player_center):
+        """One frame of AI: the due decisions within the budget, then movement of every enemy."""
+        self.frame += 1
+        frame = self.frame
+        last_decision = self.last_decision
+        due = []
+        for enemy in enemies:
+            last = last_decision.get(enemy)
+            tier = self.get_tier(enemy, view_rect, player_center)
+            if last is None or frame - last >= AI_TIER_INTERVALS[tier]:
+                # новые враги решают сразу; дальше — ближний уровень и дольше ждавшие первыми
+                due.append((tier, last if last is not None else -1, len(due), enemy))
+        due.sort()
+        budget = self.budget_ms / 1000.0
+        started = time.perf_counter()
+        decided = 0
+        for tier, last, _, enemy in due:
+            if decided and time.perf_counter() - started >= budget:
+                break
+            enemy.think(enemies, frame - last if last >= 0 else 1)
+            last_decision[enemy] = frame
+            decided += 1
+        self.used_ms = (time.perf_counter() - started) * 1000.0
+        self.peak_ms = max(self.peak_ms, self.used_ms)
+        self.decided = decided
+        self.deferred = len(due) - decided
+        for enemy in enemies:
+            enemy.move()
+
+    def report(self):
+        """Budget use of the last frame as a line of text."""
+        share = self.used_ms / self.budget_ms * 100 if self.budget_ms else 0.0
+        return (f"AI {self.used_ms:.2f}/{self.budget_ms:.2f} ms ({share:.0f}%), peak {self.peak_ms:.2f} ms, "
+                f"decided {self.decided}, deferred {self.deferred}")
@@ -1,4 +1,10 @@
 import pygame
+from atlas import TextureAtlas
+
+# Листы анимаций, упакованные в общий атлас спрайтов
+DOORS_SHEET = 'img/animations/!Doors.png'
+PLAYER_SHEET = 'img/animations/!Player.png'
+ENEMY_SHEET = 'img/animations/!Enemy_w.png'
 
 class BitmapFont:
     def __init__(self, image_path, char_map, char_width=40, char_height=24):
@@ -57,6 +63,15 @@ class Animation:
         self.current_frame = 0
         self.counter = 0
         self.frame_start = frame_start  # (x, y) tuple
+        # Если задан атлас, кадры берутся из его области для листа atlas_key
+        self.atlas = None
+        self.atlas_key = None
+
+    def use_atlas(self, atlas, key):
+        """Draw frames from the sheet packed into atlas under key instead of from self.image"""
+        self.atlas = atlas
+        self.atlas_key = key
+        self.image = atlas.surface
 
     def update(self):
         self.counter += 1
@@ -73,9 +88,18 @@ class Animation:
             self.FRAME_HEIGHT
         )
 
-    def draw(self, surface, x, y):
+    def get_source_area(self, frame_rect):
+        if self.atlas is None:
+            return frame_rect
+        return self.atlas.region(self.atlas_key, frame_rect)
+
+    def get_blit(self, x, y):
+        """(image, dest, area) tuple of the current frame, for Surface.blits"""
         frame_rect = self.get_frame_rect(self.current_frame)
-        surface.blit(self.image, (x, y), frame_rect)
+        return (self.image, (x, y), self.get_source_area(frame_rect))
+
+    def draw(self, surface, x, y):
+        surface.blit(*self.get_blit(x, y))
 
 class DoorAnimation(Animation):
     def __init__(self, image):
@@ -120,10 +144,10 @@ class PlayerAnimation(Animation):
             self.anim_index = (self.anim_index + 1) % 3
             self.counter = 0
 
-    def draw(self, surface, x, y):
+    def get_blit(self, x, y):
         frame_pos = self.frame_coords[self.direction][self.anim_index]
         frame_rect = pygame.Rect(frame_pos[0], frame_pos[1], self.FRAME_WIDTH, self.FRAME_HEIGHT)
-        surface.blit(self.image, (x, y), frame_rect)
+        return (self.image, (x, y), self.get_source_area(frame_rect))
 
 class TextMessageAnimation(Animation):
     def __init__(self, image, screen_width, screen_height):
@@ -204,49 +228,89 @@ _player_anim = None
 _text_message_image = None
 _text_message_anim = None
 _bitmap_font = None
+_sprite_atlas = None
+_sheet_images = {}  # путь листа -> конвертированная поверхность
+_sprite_frames = {}  # (путь листа, (x, y, w, h)) -> кадр
+
+def get_sheet_image(path):
+    """Sprite sheet loaded from disk and converted once per process."""
+    image = _sheet_images.get(path)
+    if image is None:
+        image = pygame.image.load(path).convert_alpha()
+        _sheet_images[path] = image
+    return image
+
+def get_sprite_frame(path, rect):
+    """
+    Shared frame of a sprite sheet keyed by the sheet path and the frame rect (x, y, w, h).
+    Frames are subsurfaces of the shared sheet, so they take no extra memory and must not be drawn on.
+    """
+    key = (path, tuple(rect))
+    frame = _sprite_frames.get(key)
+    if frame is None:
+        frame = get_sheet_image(path).subsurface(rect)
+        _sprite_frames[key] = frame
+    return frame
+
+def get_sprite_atlas():
+    """Общий атлас листов анимаций (двери, игрок, враг)"""
+    global _sprite_atlas
+    if _sprite_atlas is None:
+        _sprite_atlas = TextureAtlas()
+        _sprite_atlas.add(DOORS_SHEET, get_door_anim_image())
+        _sprite_atlas.add(PLAYER_SHEET, get_player_anim_image())
+        _sprite_atlas.add(ENEMY_SHEET, get_sheet_image(ENEMY_SHEET))
+        _sprite_atlas.build()
+    return _sprite_atlas
+
+def get_door_atlas_animation(anim_class):
+    anim = anim_class(get_door_anim_image())
+    anim.use_atlas(get_sprite_atlas(), DOORS_SHEET)
+    return anim
 
 def get_door_anim_image():
     global _door_anim_image
     if _door_anim_image is None:
-        _door_anim_image = pygame.image.load('img/animations/!Doors.png').convert_alpha()
+        _door_anim_image = pygame.image.load(DOORS_SHEET).convert_alpha()
     return _door_anim_image
 
 def get_door_animation():
     global _door_anim
     if _door_anim is None:
-        _door_anim = DoorAnimation(get_door_anim_image())
+        _door_anim = get_door_atlas_animation(DoorAnimation)
     return _door_anim
 
 def get_special_door_animation():
     global _special_door_anim
     if _special_door_anim is None:
-        _special_door_anim = SpecialDoorAnimation(get_door_anim_image())
+        _special_door_anim = get_door_atlas_animation(SpecialDoorAnimation)
     return _special_door_anim
 def get_lift_door_animation():
     global _lift_door_anim
     if _lift_door_anim is None:
-        _lift_door_anim = LiftDoorAnimation(get_door_anim_image())
+        _lift_door_anim = get_door_atlas_animation(LiftDoorAnimation)
     return _lift_door_anim
 def get_liftbot_door_animation():
     global _lift_doorbot_anim
     if _lift_doorbot_anim is None:
-        _lift_doorbot_anim = LiftDoorBotAnimation(get_door_anim_image())
+        _lift_doorbot_anim = get_door_atlas_animation(LiftDoorBotAnimation)
     return _lift_doorbot_anim
 def get_close_door_animation():
     global _close_door_anim
     if _close_door_anim is None:
-        _close_door_anim = CloseDoorAnimation(get_door_anim_image())
+        _close_door_anim = get_door_atlas_animation(CloseDoorAnimation)
     return _close_door_anim
 def get_player_anim_image():
     global _player_anim_image
     if _player_anim_image is None:
-        _player_anim_image = pygame.image.load('img/animations/!Player.png').convert_alpha()
+        _player_anim_image = pygame.image.load(PLAYER_SHEET).convert_alpha()
     return _player_anim_image
 
 def get_player_animation(frame_coords, frame_duration=8):
     global _player_anim
     if _player_anim is None:
         _player_anim = PlayerAnimation(get_player_anim_image(), frame_coords, frame_duration)
+        _player_anim.use_atlas(get_sprite_atlas(), PLAYER_SHEET)
     return _player_anim
 def get_text_message_image():
     global _text_message_image
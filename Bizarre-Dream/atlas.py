@@ -0,0 +1,68 @@
+import pygame
+
+class TextureAtlas:
+    """
+    Packs several source surfaces (tile images, animation sheets) into one SRCALPHA surface.
+    Surfaces are placed with simple shelf packing (tallest first).
+    After build(), region(key, area) returns the Rect of a source area inside atlas.surface,
+    so a frame can be drawn with surface.blit(atlas.surface, dest, atlas.region(key, area))
+    or batched with Surface.blits.
+    """
+    MAX_WIDTH = 2048
+
+    def __init__(self, max_width=MAX_WIDTH):
+        self.max_width = max_width
+        self.sources = {}  # key -> Surface, до build()
+        self.regions = {}  # key -> Rect в атласе
+        self.surface = None
+
+    def add(self, key, surface):
+        self.sources[key] = surface
+
+    def build(self):
+        """Packs all added surfaces and returns the atlas surface."""
+        order = sorted(self.sources.items(), key=lambda item: item[1].get_height(), reverse=True)
+        positions = {}
+        x = y = shelf_height = width = 0
+        for key, source in order:
+            w, h = source.get_size()
+            if x and x + w > self.max_width:
+                # новая полка
+                y += shelf_height
+                x = shelf_height = 0
+            positions[key] = pygame.Rect(x, y, w, h)
+            x += w
+            width = max(width, x)
+            shelf_height = max(shelf_height, h)
+        self.surface = pygame.Surface((max(1, width), max(1, y + shelf_height)), pygame.SRCALPHA)
+        for key, rect in positions.items():
+            self.surface.blit(self.sources[key], rect)
+        self.regions = positions
+        self.sources = {}
+        return self.surface
+
+    def __contains__(self, key):
+        return key in self.regions
+
+    def region(self, key, area=None):
+        """Rect inside the atlas for the whole source or for an area given in source coordinates."""
+        rect = self.regions[key]
+        if area is None:
+            return rect.copy()
+        # обрезаем по границе исходного листа, чтобы не захватить соседний в атласе
+        return pygame.Rect(rect.x + area[0], rect.y + area[1], area[2], area[3]).clip(rect)
+
+def build_tile_atlas(images):
+    """
+    Packs tile images into one SRCALPHA surface.
+    Returns (atlas, rects) where rects[gid] is (x, y, w, h) or None for empty gids.
+    """
+    atlas = TextureAtlas()
+    for gid, image in enumerate(images):
+        if image:
+            atlas.add(gid, image)
+    surface = atlas.build()
+    rects = [None] * len(images)
+    for gid, rect in atlas.regions.items():
+        rects[gid] = tuple(rect)
+    return surface, rects
@@ -0,0 +1,87 @@
+import glob
+import heapq
+import os
+import random
+import sys
+import time
+from map_cache import LoadedMap
+from pathfinding import GridPathfinder
+
+PAIRS = 200  # случайных пар (старт, цель) на карту
+
+def legacy_astar(grid, start, goal):
+    """The former Enemy.astar (tuple nodes, dict scores, list path) as the baseline."""
+    def heuristic(a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    open_set = [(0, start)]
+    came_from = {}
+    g_score = {start: 0}
+    closed = set()
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        if current == goal:
+            path = [current]
+            while current in came_from:
+                current = came_from[current]
+                path.append(current)
+            path.reverse()
+            return path
+        closed.add(current)
+        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            neighbor = (current[0] + dx, current[1] + dy)
+            if grid.is_blocked(neighbor[0], neighbor[1]) or neighbor in closed:
+                continue
+            tentative_g = g_score[current] + 1
+            if neighbor not in g_score or tentative_g < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g
+                heapq.heappush(open_set, (tentative_g + heuristic(neighbor, goal), neighbor))
+    return []
+
+def time_searches(searches, queries):
+    """{name: (seconds, path lengths)} of every search over the queries."""
+    results = {}
+    for name, search in searches:
+        started = time.perf_counter()
+        lengths = [len(search(s, g)) for s, g in queries]
+        results[name] = (time.perf_counter() - started, lengths)
+    return results
+
+def print_results(title, results):
+    """One line per search: time per path, speedup over legacy and whether path lengths match it."""
+    count = len(next(iter(results.values()))[1])
+    print(f"  {title}: {count} paths")
+    if not count:
+        return
+    base_time, base_lengths = results['legacy']
+    for name, (elapsed, lengths) in results.items():
+        same = lengths == base_lengths
+        print(f"    {name:7} {elapsed / count * 1000:7.3f} ms/path  x{base_time / elapsed:6.1f}  "
+              f"lengths {'ok' if same else 'DIFFER'}")
+
+def bench_map(filename, pairs=PAIRS, seed=1):
+    """
+    Times legacy A*, astar and jps over random pairs of free tiles.
+    Reachable pairs and pairs in different regions are reported separately:
+    the new searches reject the latter by region labels without searching.
+    """
+    grid = LoadedMap(filename).index.grid
+    free = [(x, y) for y in range(grid.height) for x in range(grid.width) if not grid.is_blocked(x, y)]
+    rng = random.Random(seed)
+    queries = [(rng.choice(free), rng.choice(free)) for _ in range(pairs)]
+    reachable = [(s, g) for s, g in queries if grid.connected(s, g)]
+    unreachable = [(s, g) for s, g in queries if not grid.connected(s, g)]
+    pathfinder = GridPathfinder(grid)
+    searches = (('legacy', lambda s, g: legacy_astar(grid, s, g)),
+                ('astar', pathfinder.astar), ('jps', pathfinder.jps))
+    print(f"{os.path.basename(filename)}: {grid.width}x{grid.height}, {grid.region_count} regions")
+    print_results('reachable', time_searches(searches, reachable))
+    print_results('different regions', time_searches(searches, unreachable))
+
+if __name__ == "__main__":
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    for filename in sys.argv[1:] or sorted(glob.glob(os.path.join('maps', '*.tmx'))):
+        bench_map(filename)
@@ -1,7 +1,9 @@
 import pygame
 import math
-import heapq
+from collections import deque
 from audio import get_audio_manager
+from animations import get_sprite_atlas, get_sprite_frame
+from pathfinding import get_pathfinder
 
 DIRECTIONS = ['down', 'left', 'right', 'up']
 
@@ -9,7 +11,7 @@ class Enemy:
     SPRITE_SIZE = (32, 64)
     def __init__(self, x, y, player_ref, get_fov_polygon, tile_width, tile_height, obstacles,
                  sprite_path='img/animations/!Enemy_w.png', frame_coords={'down': (0, 0),'left': (0, 64),'right': (0, 128),'up': (0, 192)
-}):
+}, flow_field=None, occupancy=None):
         self.x = x  # в пикселях
         self.y = y
         self.player_ref = player_ref  # ссылка на игрока (для слежения)
@@ -18,14 +20,29 @@ class Enemy:
         self.tile_height = tile_height
         self.speed = 2  # пикселя за кадр
         self.obstacles = obstacles
+        # Общее для всех врагов поле преследования (navigation.FlowField); без него — свой A*
+        self.flow_field = flow_field
+        # Общая карта занятых врагами тайлов (navigation.EnemyOccupancy); без неё — обход списка врагов
+        self.occupancy = occupancy
+        self.tile = self.get_tile()  # тайл, под которым враг записан в occupancy
+        if occupancy is not None:
+            occupancy.add(self.tile)
         # AI
-        self.path = []
+        self.path = deque()
         self.target_tile = None
         self.last_player_tile = None
+        # Тайлы других врагов: живое представление occupancy или множество на момент последнего решения
+        self.occupied = occupancy.others(self.tile) if occupancy is not None else set()
         # Направление движения
         self.direction = 'down'
         # Загрузка спрайтов по направлениям
         self.sprites = self.load_directional_sprites(sprite_path, frame_coords)
+        # Области кадров в общем атласе спрайтов (если лист в него упакован)
+        self.sprite_path = sprite_path
+        self.frame_coords = frame_coords or {}
+        self.atlas = get_sprite_atlas()
+        if sprite_path not in self.atlas:
+            self.atlas = None
         # Ограничение частоты пересчёта пути
         self.repath_cooldown = 0  # в кадрах
         self.REPATH_DELAY = 12  # 12 кадров = 0.2 сек при 60 FPS
@@ -39,18 +56,17 @@ class Enemy:
     @staticmethod
     def load_directional_sprites(sprite_path, frame_coords):
         """
-        Загружает спрайты врага для каждого направления.
+        Спрайты врага для каждого направления — общие кадры реестра (animations.get_sprite_frame),
+        лист читается с диска один раз на процесс, а не на каждого врага.
         frame_coords: dict {'down': (x, y), ...} — координаты левого верхнего угла кадра для каждого направления
         """
-        image = pygame.image.load(sprite_path).convert_alpha()
         sprites = {}
         for dir in DIRECTIONS:
             if frame_coords and dir in frame_coords:
                 x, y = frame_coords[dir]
             else:
                 x, y = 0, 0  # по умолчанию
-            rect = pygame.Rect(x, y, 32, 64)
-            sprites[dir] = image.subsurface(rect).copy()
+            sprites[dir] = get_sprite_frame(sprite_path, (x, y, 32, 64))
         return sprites
 
     def get_hitbox(self):
@@ -71,88 +87,89 @@ class Enemy:
         return False
 
     def is_colliding(self, px, py):
-        left = int(px / self.tile_width)
-        right = int((px + self.tile_width - 1) / self.tile_width)
-        top = int(py / self.tile_height)
-        bottom = int((py + self.tile_height - 1) / self.tile_height)
-        for tx in range(left, right + 1):
-            for ty in range(top, bottom + 1):
-                if (tx, ty) in self.obstacles:
-                    return True
-        return False
+        return self.obstacles.area_blocked(px, py, self.tile_width, self.tile_height)
 
     def get_tile(self):
         return (int(self.x // self.tile_width), int(self.y // self.tile_height))
 
+    def update_tile(self):
+        """Moves the enemy's entry in the shared occupancy when it enters another tile."""
+        tile = self.get_tile()
+        if tile != self.tile:
+            if self.occupancy is not None:
+                self.occupancy.move(self.tile, tile)
+                self.occupied.own_tile = tile
+            self.tile = tile
+
     def get_player_tile(self):
         player_cx, player_cy = self.player_ref()
         return (int(player_cx // self.tile_width), int(player_cy // self.tile_height))
 
-    def reconstruct_path(self, came_from, current):
-        path = [current]
-        while current in came_from:
-            current = came_from[current]
-            path.append(current)
-        path.reverse()
-        return path
-
-    def astar(self, start, goal, occupied=None):
-        def heuristic(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
-        open_set = []
-        heapq.heappush(open_set, (0, start))
-        came_from = {}
-        g_score = {start: 0}
-        f_score = {start: heuristic(start, goal)}
-        closed = set()
-        while open_set:
-            _, current = heapq.heappop(open_set)
-            if current == goal:
-                return self.reconstruct_path(came_from, current)
-            closed.add(current)
-            for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)]:
-                neighbor = (current[0]+dx, current[1]+dy)
-                if neighbor in self.obstacles or neighbor in closed:
-                    continue
-                if occupied and neighbor in occupied and neighbor != goal:
-                    continue
-                tentative_g = g_score[current] + 1
-                if neighbor not in g_score or tentative_g < g_score[neighbor]:
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g
-                    f_score[neighbor] = tentative_g + heuristic(neighbor, goal)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
-        return []
-
     def update(self, enemies=None):
-        was_moving = self.is_moving  # Сохраняем предыдущее состояние движения
-        self.is_moving = False  # Сбрасываем флаг движения
-        
-        if not self.is_in_fov():
-            player_tile = self.get_player_tile()
-            my_tile = self.get_tile()
-            occupied = set()
-            if enemies:
-                for e in enemies:
-                    if e is not self:
-                        occupied.add(e.get_tile())
+        """Decision and movement in one frame (without an AIScheduler)."""
+        self.think(enemies)
+        self.move()
+
+    def think(self, enemies=None, frames=1):
+        """
+        The AI decision: the tiles taken by other enemies and the next tiles to walk (path).
+        frames — frames passed since the previous decision (the AIScheduler runs far enemies less often).
+        """
+        if self.is_in_fov():
+            return  # в луче — стоит на месте и не думает
+        if self.repath_cooldown > 0:
+            self.repath_cooldown = max(0, self.repath_cooldown - frames)
+        player_tile = self.get_player_tile()
+        my_tile = self.get_tile()
+        if self.occupancy is None:
+            self.occupied = {e.get_tile() for e in enemies or () if e is not self}
+        occupied = self.occupied
+        if self.flow_field is not None:
+            # Следующий шаг берётся из общего поля; поле пересчитывается раз на смену тайла игрока
+            self.flow_field.update(player_tile)
+            if not self.path or self.path[0] in occupied:
+                # шаг занят другим врагом — выбираем заново, а не ждём
+                self.next_field_step(my_tile)
+                if not self.path and my_tile != player_tile and self.repath_cooldown == 0:
+                    # поле не даёт свободного шага: обходим занятые тайлы по A*
+                    self.find_path_to(my_tile, player_tile)
+                self.target_tile = player_tile
+        else:
             # Пересчитываем путь только если cooldown == 0
             need_repath = (
                 not self.path or self.target_tile != player_tile or (self.path and my_tile == self.path[0])
             )
             if need_repath and self.repath_cooldown == 0:
-                path = self.astar(my_tile, player_tile, occupied)
-                if path and len(path) > 1:
-                    self.path = path[1:]
-                    self.target_tile = player_tile
-                else:
-                    self.path = []
-                self.repath_cooldown = self.REPATH_DELAY
-            if self.repath_cooldown > 0:
-                self.repath_cooldown -= 1
+                self.find_path_to(my_tile, player_tile)
+
+    def find_path_to(self, my_tile, player_tile):
+        """A* path to the player around the tiles taken by other enemies; starts the repath cooldown."""
+        path = get_pathfinder(self.obstacles).find_path(my_tile, player_tile, self.occupied)
+        if len(path) > 1:
+            path.popleft()
+            self.path = path
+            self.target_tile = player_tile
+        else:
+            self.path = deque()
+        self.repath_cooldown = self.REPATH_DELAY
+
+    def next_field_step(self, tile):
+        """Takes the next tile from the flow field into path (empty if there is nowhere to go)."""
+        step = self.flow_field.next_step(tile, self.occupied)
+        self.path = deque([step]) if step else deque()
+
+    def move(self):
+        """
+        Walks one frame along the path chosen by the last think (called every frame),
+        so enemies that decide rarely still move smoothly.
+        """
+        was_moving = self.is_moving  # Сохраняем предыдущее состояние движения
+        self.is_moving = False  # Сбрасываем флаг движения
+
+        if not self.is_in_fov():
             if self.path:
                 next_tile = self.path[0]
-                if next_tile in occupied:
+                if next_tile in self.occupied:
                     return  # ждём, не двигаемся
                 next_x = next_tile[0] * self.tile_width
                 next_y = next_tile[1] * self.tile_height
@@ -166,15 +183,19 @@ class Enemy:
                 if dist < self.speed:
                     self.x = next_x
                     self.y = next_y
-                    self.path.pop(0)
+                    self.path.popleft()
+                    if not self.path and self.flow_field is not None:
+                        # следующий шаг по полю сразу, не дожидаясь следующего решения
+                        self.next_field_step(next_tile)
                 else:
                     self.x += self.speed * dx / dist
                     self.y += self.speed * dy / dist
                     self.is_moving = True  # Враг движется
+                self.update_tile()
         else:
             # Если в луче — стоит на месте
             pass
-            
+
         # Звуки крика (вынесено за пределы блока is_in_fov)
         if self.is_moving and not was_moving:  # Начало движения
             self.audio_manager.play_enemy_scream()
@@ -185,14 +206,21 @@ class Enemy:
         elif not self.is_moving and was_moving:  # Остановка движения
             self.audio_manager.stop_enemy_scream()  # Прерываем звук крика
 
-    def draw(self, surface, cam_x, cam_y):
+    def get_blit(self, cam_x, cam_y):
+        """(image, dest, area) tuple of the current frame, for Surface.blits"""
         px = self.x - cam_x
         py = self.y - cam_y
-        frame = self.sprites[self.direction]
         # Центрируем по X, низ кадра = низ хитбокса
         offset_x = px - (self.SPRITE_SIZE[0] - self.tile_width) // 2
         offset_y = py - (self.SPRITE_SIZE[1] - self.tile_height)
-        surface.blit(frame, (offset_x, offset_y))
+        if self.atlas is not None:
+            x, y = self.frame_coords.get(self.direction, (0, 0))
+            area = self.atlas.region(self.sprite_path, (x, y) + self.SPRITE_SIZE)
+            return (self.atlas.surface, (offset_x, offset_y), area)
+        return (self.sprites[self.direction], (offset_x, offset_y), None)
+
+    def draw(self, surface, cam_x, cam_y):
+        surface.blit(*self.get_blit(cam_x, cam_y))
         # DEBUG: рисуем хитбокс врага
        # hitbox_rect = pygame.Rect(px, py, self.tile_width, self.tile_height)
        # pygame.draw.rect(surface, (255, 0, 0), hitbox_rect, 2)
@@ -1,7 +1,7 @@
 import pygame
 import sys
 from controls import update_button_states, is_button_pressed, get_mouse_pos, handle_event
-from tmx_loader import load_tmx_map, draw_tmx_map, get_collision_rects, get_trigger_infos, get_enemy_infos
+from map_cache import get_map_cache, get_map_prefetcher
 from animations import get_door_animation, get_special_door_animation, get_lift_door_animation, \
 get_liftbot_door_animation, get_player_animation, get_close_door_animation, get_text_message_image, get_bitmap_font
 from view import Camera
@@ -10,6 +10,8 @@ from audio import get_audio_manager
 import re
 import os
 from enemy import Enemy
+from navigation import FlowField, EnemyOccupancy
+from ai_scheduler import AIScheduler, AI_VIEW_MARGIN_TILES
 from player import Player
 
 # Create constant screen system
@@ -18,6 +20,7 @@ SCREEN_HEIGHT = 1024
 FPS = 60
 HITBOX_COLOR = (255, 0, 0)  # Красный цвет для хитбокса игрока
 COLLISION_COLOR = (0, 0, 255, 0)  # Полупрозрачный синий для объектов-коллизий
+DOOR_SPRITE_MARGIN_TILES = 4  # насколько тайлов спрайт двери может выходить за тайл своего триггера
 
 # Constant internal resolution - never changes
 INTERNAL_WIDTH = 1024
@@ -120,6 +123,7 @@ class GameState:
         self.fade_alpha = 0
         self.fade_speed = 7  # Higher is faster (0-255 per frame)
         self.next_map_info = None  # (dest_map_file, pos)
+        self.next_map_prepared = False  # карта перехода уже подготовлена во время затемнения
         # --- Player Animation ---
         frame_coords = {
             'down': [(32, 0), (0, 0), (64, 0)],
@@ -138,33 +142,47 @@ class GameState:
         self._elevator_lock = False  # Для предотвращения спама звука лифта
 
     def load_map(self):
-        self.tmx_data = load_tmx_map(self.map_file)
-        self.collision_rects = get_collision_rects(self.tmx_data)
-        self.trigger_infos = get_trigger_infos(self.tmx_data)
-        self.tile_width = self.tmx_data.tilewidth
-        self.tile_height = self.tmx_data.tileheight
-        self.grid_width = self.tmx_data.width
-        self.grid_height = self.tmx_data.height
+        # Карта и производные данные берутся из общего LRU-кэша (повторный визит без перезагрузки)
+        self.map_data = get_map_cache().get(self.map_file)
+        # Статические слои тайлов запечены в чанки один раз при загрузке
+        # (предзагруженная без дисплея карта конвертируется и запекается здесь, если не успела во время затемнения)
+        self.map_renderer = self.map_data.prepare()
+        # Объекты карты (коллизии, триггеры, враги) собраны в MapIndex за один проход при загрузке
+        self.map_index = self.map_data.index
+        self.collision_rects = self.map_index.collision_rects
+        self.trigger_infos = self.map_index.triggers
+        self.tile_width = self.map_data.tile_width
+        self.tile_height = self.map_data.tile_height
+        self.grid_width = self.map_data.width
+        self.grid_height = self.map_data.height
         self.map_pixel_width = self.grid_width * self.tile_width
         self.map_pixel_height = self.grid_height * self.tile_height
-        self.obstacles = self.build_obstacle_set(self.collision_rects, self.tile_width, self.tile_height)
+        # Сетка занятости карты (общая для игрока, врагов и FOV)
+        self.obstacles = self.map_index.grid
         # Игрок
         self.player = Player(
             x=self.player_pos[0] * self.tile_width,
             y=self.player_pos[1] * self.tile_height,
             tile_width=self.tile_width,
             tile_height=self.tile_height,
-            obstacles=self.obstacles
+            obstacles=self.obstacles,
+            walls=self.map_index.walls
         )
         # Загрузка врагов
+        # Поле преследования игрока, общее для всех врагов карты (таблицы всех пар, если карта их включает)
+        self.flow_field = self.map_data.nav_table or FlowField(self.obstacles)
+        # Занятые врагами тайлы, обновляются самими врагами при переходе на другой тайл
+        self.enemy_occupancy = EnemyOccupancy()
+        # Решения врагов в пределах бюджета кадра
+        self.ai_scheduler = AIScheduler()
         self.enemies = []
-        enemy_infos = get_enemy_infos(self.tmx_data)
-        for einfo in enemy_infos:
+        for einfo in self.map_index.enemies:
             def player_center():
                 return self.player.get_center()
             def get_fov_poly():
                 return self.player.get_fov_polygon(self.camera.offset_x, self.camera.offset_y)
-            enemy = Enemy(einfo['x'], einfo['y'], player_center, get_fov_poly, self.tile_width, self.tile_height, self.obstacles)
+            enemy = Enemy(einfo['x'], einfo['y'], player_center, get_fov_poly, self.tile_width, self.tile_height, self.obstacles,
+                          flow_field=self.flow_field, occupancy=self.enemy_occupancy)
             enemy.player = self.player  # <--- добавлено для корректной работы is_in_fov
             self.enemies.append(enemy)
         # Determine current floor from map filename
@@ -178,54 +196,72 @@ class GameState:
             self.phone_sound_timer = 0
             self.audio_manager.play_domphone_sound()
 
-    def build_obstacle_set(self, collision_rects, tile_width, tile_height):
-        obstacles = set()
-        for rect in collision_rects:
-            left = rect.left // tile_width
-            right = (rect.right - 1) // tile_width
-            top = rect.top // tile_height
-            bottom = (rect.bottom - 1) // tile_height
-            for tx in range(left, right + 1):
-                for ty in range(top, bottom + 1):
-                    obstacles.add((tx, ty))
-        return obstacles
+        # Фоновая предзагрузка карт, куда ведут триггеры этой карты
+        get_map_prefetcher().prefetch(self.get_prefetch_targets())
+
+    def prepare_next_map(self):
+        """
+        Converts and bakes the destination map of the transition during the fade-out,
+        once the prefetcher has it in the cache, so the map change frame only switches state.
+        """
+        if not self.next_map_info or self.next_map_prepared:
+            return
+        cache = get_map_cache()
+        dest_map_file = self.next_map_info[0]
+        if dest_map_file not in cache:
+            return  # ещё грузится в фоне (или не предзагружалась) — догрузится при смене карты
+        cache.get(dest_map_file, touch=False).prepare()
+        self.next_map_prepared = True
+
+    def get_prefetch_targets(self):
+        """
+        Returns map files reachable from the current map's triggers:
+        door destinations and, for elevator triggers, every floor map.
+        """
+        targets = []
+        for trig in self.trigger_infos:
+            dest_map = trig["dest_map"]
+            if not dest_map or dest_map in ("save", "sofa") or 'clos' in dest_map:
+                continue
+            if "_lift00" in dest_map:
+                names = self.floor_to_map.values()
+            else:
+                names = [self.parse_trigger_name(dest_map)[0]]
+            for name in names:
+                map_file = f"maps/{name}.tmx"
+                if map_file != self.map_file and map_file not in targets and os.path.exists(map_file):
+                    targets.append(map_file)
+        return targets
 
     def is_colliding(self, px, py):
         # Check all tiles covered by the player's rectangle
-        left = int(px / self.tile_width)
-        right = int((px + self.tile_width - 1) / self.tile_width)
-        top = int(py / self.tile_height)
-        bottom = int((py + self.tile_height - 1) / self.tile_height)
-        for tx in range(left, right + 1):
-            for ty in range(top, bottom + 1):
-                if (tx, ty) in self.obstacles:
-                    return True
-        return False
+        return self.obstacles.area_blocked(px, py, self.tile_width, self.tile_height)
 
     def is_on_trigger(self, x, y):
-        player_rect = pygame.Rect(x * self.tile_width, y * self.tile_height, self.tile_width, self.tile_height)
-        for trig in self.trigger_infos:
-            if player_rect.colliderect(trig["rect"]):
-                # Новая логика: если триггер содержит '_rightm', дверь закрыта
-                if 'clos' in trig["dest_map"]:
-                    if not self._rightm_lock:
-                        self.text_message_manager.show_message("ДВЕРЬ ЗАКРЫТА!")
-                        self.audio_manager.play_door_sound(False)  # Звук закрытой двери
-                        self._rightm_lock = True
-                    return None
-                # Обработка триггера дивана
-                elif trig["dest_map"] == "sofa":
-                    if not self.sofa_dialog_active:
-                        self.sofa_dialog_active = True
-                        self.sofa_dialog_choice = None
-                    return None
-                # Звук лифта для триггеров лифта
-                elif '_liftom' in trig["dest_map"] or '_lift00' in trig["dest_map"]:
-                    if not self._elevator_lock:
-                        self.audio_manager.play_elevator_door_sound()  # Звук лифта
-                        self._elevator_lock = True
-                return trig
-        return None
+        # Триггеры под тайлом берутся из пространственного хеша MapIndex
+        triggers = self.map_index.triggers_at(x, y)
+        if not triggers:
+            return None
+        trig = triggers[0]
+        # Новая логика: если триггер содержит '_rightm', дверь закрыта
+        if 'clos' in trig["dest_map"]:
+            if not self._rightm_lock:
+                self.text_message_manager.show_message("ДВЕРЬ ЗАКРЫТА!")
+                self.audio_manager.play_door_sound(False)  # Звук закрытой двери
+                self._rightm_lock = True
+            return None
+        # Обработка триггера дивана
+        elif trig["dest_map"] == "sofa":
+            if not self.sofa_dialog_active:
+                self.sofa_dialog_active = True
+                self.sofa_dialog_choice = None
+            return None
+        # Звук лифта для триггеров лифта
+        elif '_liftom' in trig["dest_map"] or '_lift00' in trig["dest_map"]:
+            if not self._elevator_lock:
+                self.audio_manager.play_elevator_door_sound()  # Звук лифта
+                self._elevator_lock = True
+        return trig
 
     def handle_event(self, event):
         update_button_states(event)
@@ -337,6 +373,7 @@ class GameState:
         # Handle fade logic
         if self.fading:
             if self.fade_out:
+                self.prepare_next_map()
                 self.fade_alpha += self.fade_speed
                 if self.fade_alpha >= 255:
                     self.fade_alpha = 255
@@ -381,9 +418,11 @@ class GameState:
 
         # Обновление игрока
         self.player.update(cam_x=self.camera.offset_x, cam_y=self.camera.offset_y)
-        # Обновление врагов
-        for enemy in getattr(self, 'enemies', []):
-            enemy.update(self.enemies)
+        # Обновление врагов: далёкие и за экраном решают реже, все двигаются каждый кадр
+        margin = AI_VIEW_MARGIN_TILES * max(self.tile_width, self.tile_height)
+        view_rect = pygame.Rect(self.camera.offset_x - margin, self.camera.offset_y - margin,
+                                self.camera.screen_width + 2 * margin, self.camera.screen_height + 2 * margin)
+        self.ai_scheduler.update(self.enemies, view_rect, self.player.get_center())
             
         # Проверка столкновения игрока с врагом
         if not self.game_ending:
@@ -427,20 +466,28 @@ class GameState:
         cam_x = int(self.camera.offset_x)
         cam_y = int(self.camera.offset_y)
 
+        # Все спрайты кадра (карта, двери, игрок) собираются в один пакет для world_surface.blits
         # Draw map at (0, 0) minus camera offset
-        draw_tmx_map(world_surface, self.tmx_data, -cam_x, -cam_y)
-
-        # Draw collision objects
-        collision_surface = pygame.Surface((INTERNAL_WIDTH, INTERNAL_HEIGHT), pygame.SRCALPHA)
-        for rect in self.collision_rects:
-            offset_rect = rect.copy()
-            offset_rect.x -= cam_x
-            offset_rect.y -= cam_y
-            pygame.draw.rect(collision_surface, COLLISION_COLOR, offset_rect)
-        world_surface.blit(collision_surface, (0, 0))
+        view_w, view_h = world_surface.get_size()
+        batch = self.map_renderer.get_blits(view_w, view_h, -cam_x, -cam_y)
+
+        # Draw collision objects (only if the debug color is not fully transparent)
+        if COLLISION_COLOR[3] > 0:
+            collision_surface = pygame.Surface((INTERNAL_WIDTH, INTERNAL_HEIGHT), pygame.SRCALPHA)
+            for rect in self.collision_rects:
+                offset_rect = rect.copy()
+                offset_rect.x -= cam_x
+                offset_rect.y -= cam_y
+                pygame.draw.rect(collision_surface, COLLISION_COLOR, offset_rect)
+            world_surface.blits(batch, doreturn=False)
+            world_surface.blit(collision_surface, (0, 0))
+            batch = []
 
         # Draw doors and other objects...
-        for trig in self.trigger_infos:
+        # Только триггеры в пределах экрана, расширенного на вылет спрайта двери за тайл триггера
+        margin = DOOR_SPRITE_MARGIN_TILES * max(self.tile_width, self.tile_height)
+        view_rect = pygame.Rect(cam_x - margin, cam_y - margin, view_w + 2 * margin, view_h + 2 * margin)
+        for trig in self.map_index.triggers_in_rect(view_rect):
             if trig["dest_map"] == "save":
                 continue  # Do not draw a door for save triggers
             if trig["dest_map"] == "sofa":
@@ -477,7 +524,7 @@ class GameState:
                 anim.current_frame = 0
                 x = tile_px + (self.tile_width - anim.FRAME_WIDTH) // 2
                 y = tile_py + self.tile_height - anim.FRAME_HEIGHT - self.tile_height
-            anim.draw(world_surface, x, y)
+            batch.append(anim.get_blit(x, y))
         if self.animating_trigger:
             if self.animating_trigger["dest_map"] != "save":
                 label = self.animating_trigger["dest_map"][-7:]
@@ -507,7 +554,7 @@ class GameState:
                     anim.current_frame = frame
                     x = tile_px + (self.tile_width - anim.FRAME_WIDTH) // 2
                     y = tile_py + self.tile_height - anim.FRAME_HEIGHT - self.tile_height
-                anim.draw(world_surface, x, y)
+                batch.append(anim.get_blit(x, y))
         # Draw player hitbox
         hitbox_rect = pygame.Rect(
             self.player.x - cam_x,
@@ -518,9 +565,8 @@ class GameState:
        # pygame.draw.rect(world_surface, HITBOX_COLOR, hitbox_rect, 2)
 
         # Draw animated player
-        px = self.player.x - cam_x
-        py = self.player.y - cam_y
-        self.player_anim.draw(world_surface, px, py - 32)
+        batch.append(self.player.get_blit(cam_x, cam_y, self.player_anim))
+        world_surface.blits(batch, doreturn=False)
         debug_surface = pygame.Surface((INTERNAL_WIDTH, INTERNAL_HEIGHT), pygame.SRCALPHA)
         # for rect in self.trigger_infos:
         #     offset_rect = rect["rect"].move(-cam_x, -cam_y)
@@ -540,15 +586,16 @@ class GameState:
         if self.menu_active:
             self.elevator_menu.draw(world_surface)
 
-        # Рисуем игрока
-        self.player.draw(world_surface, cam_x, cam_y, self.player_anim)
-        # Рисуем врагов
+        # Рисуем игрока и врагов одним пакетом
+        batch = [self.player.get_blit(cam_x, cam_y, self.player_anim)]
         for enemy in getattr(self, 'enemies', []):
-            enemy.draw(world_surface, cam_x, cam_y)
+            batch.append(enemy.get_blit(cam_x, cam_y))
+        world_surface.blits(batch, doreturn=False)
 
         # --- Логика затемнения и фонарика ---
         if self.darkness_enabled:
-            self.player.draw_light(world_surface, cam_x, cam_y, self.obstacles, self.tile_width, self.tile_height, self.darkness_enabled, self.enemies)
+            self.player.draw_light(world_surface, cam_x, cam_y, self.obstacles, self.tile_width, self.tile_height, self.darkness_enabled, self.enemies,
+                                   self.map_data.lightmap)
 
         # --- Всегда рисуем пользовательский курсор мыши ---
         mouse_pos = get_mouse_pos()
@@ -715,14 +762,10 @@ class GameState:
         Find elevator exit position on destination map
         """
         try:
-            tmx_data = load_tmx_map(f"maps/{dest_map}.tmx")
-            trigger_infos = get_trigger_infos(tmx_data)
-            for trig in trigger_infos:
-                if "_liftom" in trig["dest_map"]:
-                    rect = trig["rect"]
-                    tile_x = rect.x // tmx_data.tilewidth
-                    tile_y = rect.y // tmx_data.tileheight
-                    return (tile_x, tile_y)
+            index = get_map_cache().get(f"maps/{dest_map}.tmx").index
+            trig = index.find_trigger(lambda t: "_liftom" in t["dest_map"])
+            if trig:
+                return index.trigger_tile(trig)
         except Exception as e:
             print(f"Ошибка при поиске выхода лифта на {dest_map}: {e}")
         return None
@@ -791,13 +834,9 @@ class GameState:
 
 
 def get_first_trigger_tile(map_file):
-    tmx_data = load_tmx_map(map_file)
-    trigger_infos = get_trigger_infos(tmx_data)
-    if trigger_infos:
-        rect = trigger_infos[0]["rect"]
-        tile_x = rect.x // tmx_data.tilewidth
-        tile_y = rect.y // tmx_data.tileheight
-        return (tile_x, tile_y)
+    index = get_map_cache().get(map_file).index
+    if index.triggers:
+        return index.trigger_tile(index.triggers[0])
     return (0, 0)  # fallback if no trigger
 
 
@@ -5,6 +5,17 @@ from animations import get_text_message_animation
 from audio import get_audio_manager
 
 
+_menu_images = {}
+
+def load_menu_image(path):
+    """Загружает изображение меню один раз за процесс (меню пересоздаётся при каждой смене карты)"""
+    image = _menu_images.get(path)
+    if image is None:
+        image = pygame.image.load(path).convert_alpha()
+        _menu_images[path] = image
+    return image
+
+
 class TextMessageManager:
     def __init__(self, screen_width, screen_height):
         self.text_animation = get_text_message_animation(screen_width, screen_height)
@@ -25,7 +36,7 @@ class TextMessageManager:
 class ElevatorMenu:
     def __init__(self, base_image_path, screen_size):
         # Загрузить основное изображение меню
-        self.base_image = pygame.image.load(os.path.join('img', 'elevator_menu', 'elevator_menu-export-export.png')).convert_alpha()
+        self.base_image = load_menu_image(os.path.join('img', 'elevator_menu', 'elevator_menu-export-export.png'))
         self.screen_size = screen_size
         self.visible = False
 
@@ -38,7 +49,7 @@ class ElevatorMenu:
         for i in range(0, 11):  # 1 to 11
             path = os.path.join('img', 'elevator_menu', f'elevator_menu-export-export{i}.png')
             if os.path.exists(path):
-                img = pygame.image.load(path).convert_alpha()
+                img = load_menu_image(path)
                 self.hover_images[i] = img
 
         # Инициализировать зоны (36x36 пикселей каждая)
@@ -0,0 +1,141 @@
+import math
+import pygame
+from visibility import visibility_sweep
+
+# Разрешение карты освещения: 1 — полное, 2 — 1/2, 4 — 1/4 по каждой стороне.
+# Уменьшенная маска растягивается smoothscale, что смягчает края света.
+# В pygame растяжение 1024x1024 (~3 мс) дороже, чем вся маска в полном разрешении (~0.35 мс),
+# так что это настройка вида, а не скорости.
+LIGHTMAP_SCALE = 1
+
+# Статические источники света карты: объекты слоя 'light' в TMX.
+# Свойства объекта: radius (px, по умолчанию LIGHT_RADIUS), intensity (0..1, по умолчанию 1).
+LIGHT_LAYER = 'light'
+LIGHT_RADIUS = 160
+LIGHT_FALLOFF_STEPS = 4  # колец затухания на источник
+
+class LightCompositor:
+    """
+    Owns the persistent darkness mask of Player.draw_light.
+    The lightmap is filled with the darkness alpha once; every frame only the bounding box of the
+    previous frame's light holes is refilled before the new holes are cut, and when the holes
+    and the darkness level are unchanged the mask is returned as is.
+    With scale > 1 the holes are cut in a lightmap scale times smaller and upscaled into mask.
+    """
+    def __init__(self, size, scale=LIGHTMAP_SCALE):
+        self.size = size
+        self.scale = scale
+        self.mask = pygame.Surface(size, pygame.SRCALPHA)
+        if scale == 1:
+            self.lightmap = self.mask
+        else:
+            self.lightmap = pygame.Surface((max(1, size[0] // scale), max(1, size[1] // scale)), pygame.SRCALPHA)
+        self.alpha = None  # текущий уровень затемнения маски
+        self.dirty = None  # область, где были вырезаны пятна света в прошлом кадре
+        self.last_lights = None
+        self._static_scaled = None  # (исходная статическая карта света, уменьшенная под scale)
+
+    def render(self, alpha, polygon=None, circle=None, static_lightmap=None, offset=(0, 0)):
+        """
+        Returns the mask filled with (0, 0, 0, alpha) with transparent holes for the light polygon
+        (list of points) and the circle ((x, y), radius).
+        static_lightmap — baked map lightmap (bake_static_lightmap), its area at offset (the camera)
+        lightens the darkness before the holes are cut.
+        """
+        offset = (int(offset[0]), int(offset[1])) if static_lightmap is not None else None
+        lights = (alpha, tuple(polygon) if polygon else None, circle, static_lightmap, offset)
+        if lights == self.last_lights:
+            return self.mask
+        lightmap = self.lightmap
+        scale = self.scale
+        last_static = self.last_lights[3:] if self.last_lights else (None, None)
+        if alpha != self.alpha or (static_lightmap, offset) != last_static:
+            self._refill(lightmap.get_rect(), alpha, static_lightmap, offset)
+            self.alpha = alpha
+        elif self.dirty:
+            self._refill(self.dirty, alpha, static_lightmap, offset)
+        dirty = []
+        if polygon:
+            if scale != 1:
+                polygon = [(x / scale, y / scale) for x, y in polygon]
+            dirty.append(pygame.draw.polygon(lightmap, (0, 0, 0, 0), polygon))
+        if circle:
+            (x, y), radius = circle
+            if scale != 1:
+                x, y, radius = x / scale, y / scale, radius / scale
+            dirty.append(pygame.draw.circle(lightmap, (0, 0, 0, 0), (x, y), radius))
+        self.dirty = dirty[0].unionall(dirty[1:]) if dirty else None
+        if scale != 1:
+            pygame.transform.smoothscale(lightmap, self.size, self.mask)
+        self.last_lights = lights
+        return self.mask
+
+    def _refill(self, rect, alpha, static_lightmap, offset):
+        """Restores the darkness (and the static lights) in a rect of the lightmap."""
+        self.lightmap.fill((0, 0, 0, alpha), rect)
+        if static_lightmap is None:
+            return
+        if self.scale != 1:
+            static_lightmap = self._scaled_static(static_lightmap)
+            offset = (offset[0] // self.scale, offset[1] // self.scale)
+        # Минимум по альфе: статический свет только осветляет затемнение
+        self.lightmap.blit(static_lightmap, rect.topleft, rect.move(offset), special_flags=pygame.BLEND_RGBA_MIN)
+
+    def _scaled_static(self, static_lightmap):
+        """Static lightmap reduced to the compositor scale (cached per lightmap)."""
+        cached = self._static_scaled
+        if cached is None or cached[0] is not static_lightmap:
+            w, h = static_lightmap.get_size()
+            size = (max(1, w // self.scale), max(1, h // self.scale))
+            cached = (static_lightmap, pygame.transform.smoothscale(static_lightmap, size))
+            self._static_scaled = cached
+        return cached[1]
+
+def bake_static_lightmap(index):
+    """
+    Bakes the static lights of a map (objects of the LIGHT_LAYER object layer) into a map-sized SRCALPHA surface.
+    Alpha 255 means no light, lower alpha — lit; overlapping lights add up (clamped at full light).
+    Each light is occluded by walls (full-circle visibility polygon) and fades out in LIGHT_FALLOFF_STEPS rings.
+    Returns None if the map has no lights.
+    """
+    lights = index.get_objects(LIGHT_LAYER)
+    if not lights:
+        return None
+    lightmap = pygame.Surface((index.width * index.tile_width, index.height * index.tile_height), pygame.SRCALPHA)
+    lightmap.fill((0, 0, 0, 255))
+    for light in lights:
+        properties = light['properties']
+        x = light['x'] + light['width'] / 2
+        y = light['y'] + light['height'] / 2
+        radius = float(properties.get('radius', LIGHT_RADIUS))
+        intensity = min(max(float(properties.get('intensity', 1.0)), 0.0), 1.0)
+        size = int(math.ceil(radius)) * 2 + 2
+        left = int(x) - size // 2
+        top = int(y) - size // 2
+        # Отдельная поверхность на источник, чтобы кольца не затирали соседние источники;
+        # альфа пятна — количество света, а не затемнение
+        spot = pygame.Surface((size, size), pygame.SRCALPHA)
+        spot.fill((0, 0, 0, 0))
+        for step in range(LIGHT_FALLOFF_STEPS):
+            # от внешнего кольца к внутреннему, ближе к источнику — светлее
+            ring_radius = radius * (LIGHT_FALLOFF_STEPS - step) / LIGHT_FALLOFF_STEPS
+            brightness = intensity * (step + 1) / LIGHT_FALLOFF_STEPS
+            angles, distances, _ = visibility_sweep(index.walls, x, y, 0.0, 2 * math.pi, ring_radius)
+            points = [(x + d * math.cos(a) - left, y + d * math.sin(a) - top)
+                      for a, d in zip(angles.tolist(), distances.tolist())]
+            if len(points) > 2:
+                pygame.draw.polygon(spot, (0, 0, 0, 255 - round(255 * (1 - brightness))), points)
+        # Вычитание свет складывает: пересечение двух источников светлее каждого (с насыщением в 0)
+        lightmap.blit(spot, (left, top), special_flags=pygame.BLEND_RGBA_SUB)
+    return lightmap
+
+_light_compositor = None
+
+def get_light_compositor(size, scale=None):
+    """Shared compositor (masks survive map changes); recreated if the size or scale (LIGHTMAP_SCALE by default) changes."""
+    global _light_compositor
+    if scale is None:
+        scale = LIGHTMAP_SCALE
+    if _light_compositor is None or _light_compositor.size != size or _light_compositor.scale != scale:
+        _light_compositor = LightCompositor(size, scale)
+    return _light_compositor
@@ -0,0 +1,305 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+import numpy as np
+from tmx_loader import load_tmx_map, load_tmx_images, ensure_display, MapRenderCache, get_tile_layer_infos
+from map_index import MapIndex
+from occupancy import BLOCKED
+from atlas import build_tile_atlas
+from map_compiler import load_compiled_map, save_compiled_map, get_map_dependencies
+from lighting import bake_static_lightmap, LIGHT_LAYER
+from navigation import get_nav_table, NAV_PROPERTY
+
+class LoadedMap:
+    """
+    Parsed TMX map together with everything derived from it at load time.
+    Instances are shared through MapCache and must be treated as read-only.
+    The map is read from its compiled artifact when it is up to date (tmx_data is None then),
+    otherwise it is parsed with pytmx and the artifact is rewritten.
+    headless=True loads only geometry and metadata without touching the display:
+    tile images are converted and the renderer is baked on first access to images/renderer or in prepare(),
+    which also writes the compiled artifact of such a map when it was parsed from TMX.
+    Surface work (conversion, the renderer, the lightmap) must run on the main thread: pygame/SDL does not
+    guarantee it is safe from a second thread. Other threads load maps headless through MapCache.get,
+    which runs prepare_data() before the map is published.
+    """
+    def __init__(self, filename, use_compiled=True, headless=False):
+        self.filename = filename
+        self.tmx_data = None
+        self.dependencies = []
+        self.atlas = None  # атлас тайлов (из скомпилированной карты — неконвертированный до первого доступа)
+        self.tile_rects = None
+        self._images = None
+        self._renderer = None
+        self._lightmap = None
+        self._lightmap_baked = False
+        self._nav_table = None
+        self._compile_pending = False  # headless-карта из TMX: артефакт пишется при первой подготовке
+        compiled = load_compiled_map(filename) if use_compiled else None
+        if compiled is not None:
+            self.load_compiled(compiled)
+        else:
+            self.load_tmx(headless)
+            if use_compiled and headless:
+                self._compile_pending = True  # для артефакта нужны сконвертированные картинки
+            elif use_compiled:
+                self.save_compiled()
+        self.size_bytes = self.estimate_size()
+        if not headless:
+            # Конвертация и запекание сразу; не-headless карты грузятся только в главном потоке
+            self.prepare()
+
+    def prepare(self):
+        """
+        Converts the tile images and bakes the renderer, the static lightmap
+        and the navigation tables now instead of on first use.
+        A map loaded headless from TMX also writes its compiled artifact here. Main thread only.
+        """
+        self.prepare_data()
+        self._bake_lightmap()
+        renderer = self.renderer
+        if self._compile_pending:
+            self._compile_pending = False
+            self.save_compiled()
+        return renderer
+
+    def prepare_data(self):
+        """Builds the derived data that needs no display (the navigation tables); safe on any thread."""
+        self._load_nav_table()
+
+    def save_compiled(self):
+        """Writes the compiled artifact of a map parsed from TMX (failures are reported, not raised)."""
+        try:
+            save_compiled_map(self, self.dependencies)
+        except OSError as e:
+            print(f"Не удалось сохранить скомпилированную карту {self.filename}: {e}")
+
+    def load_tmx(self, headless=False):
+        self.tmx_data = load_tmx_map(self.filename, headless=headless)
+        self.dependencies = get_map_dependencies(self.filename, self.tmx_data)
+        self.tile_width = self.tmx_data.tilewidth
+        self.tile_height = self.tmx_data.tileheight
+        self.width = self.tmx_data.width
+        self.height = self.tmx_data.height
+        self.layers = get_tile_layer_infos(self.tmx_data)
+        self.index = MapIndex.from_tmx(self.tmx_data)
+
+    def load_compiled(self, compiled):
+        for key, value in compiled.items():
+            setattr(self, key, value)
+
+    @property
+    def images(self):
+        """
+        Tile images indexed by gid, converted on first access.
+        They are subsurfaces of the tile atlas (self.atlas, rects in self.tile_rects).
+        """
+        if self._images is None:
+            if self.tmx_data is not None:
+                self.atlas, self.tile_rects = build_tile_atlas(load_tmx_images(self.tmx_data))
+            else:
+                ensure_display()
+                self.atlas = self.atlas.convert_alpha()
+            self._images = [self.atlas.subsurface(rect) if rect else None for rect in self.tile_rects]
+        return self._images
+
+    @property
+    def renderer(self):
+        """MapRenderCache of the map, baked on first access."""
+        if self._renderer is None:
+            images = self.images
+            self._renderer = MapRenderCache(self.layers, images, self.width, self.height,
+                                            self.tile_width, self.tile_height,
+                                            atlas=self.atlas, tile_rects=self.tile_rects)
+        return self._renderer
+
+    @property
+    def lightmap(self):
+        """Baked static lights of the map (lighting.bake_static_lightmap), None if the map has no lights."""
+        return self._bake_lightmap()
+
+    def _bake_lightmap(self):
+        """Bakes the static lightmap once; returns it (None if the map has no lights)."""
+        if not self._lightmap_baked:
+            self._lightmap = bake_static_lightmap(self.index)
+            self._lightmap_baked = True
+        return self._lightmap
+
+    @property
+    def nav_table(self):
+        """
+        All-pairs navigation tables (navigation.NavTable) if the map has the nav_table property, else None.
+        Read from the disk cache next to the compiled map, or built and cached on first access.
+        """
+        return self._load_nav_table()
+
+    def _load_nav_table(self):
+        """Loads (or builds) the navigation tables once if the map asks for them; returns them or None."""
+        if self._nav_table is None and self.index.properties.get(NAV_PROPERTY):
+            self._nav_table = get_nav_table(self.filename, self.index.grid)
+        return self._nav_table
+
+    def estimate_size(self):
+        """
+        Approximate memory held by the map surfaces (tile images + baked chunks), in bytes.
+        Computed from the map data, so it does not need the images to be converted.
+        """
+        pixel_bytes = 4
+        if self.tile_rects is not None:
+            tile_count = sum(1 for rect in self.tile_rects if rect)
+        else:
+            tile_count = sum(1 for image in self.tmx_data.images if image)
+        chunk_tiles = MapRenderCache.CHUNK_TILES
+        chunk_keys = set()
+        for layer in self.layers:
+            if layer['visible'] and not layer['dynamic']:
+                ys, xs = layer['gids'].nonzero()
+                chunk_keys.update(zip((xs // chunk_tiles).tolist(), (ys // chunk_tiles).tolist()))
+        tile_bytes = self.tile_width * self.tile_height * pixel_bytes
+        size = (tile_count + len(chunk_keys) * chunk_tiles * chunk_tiles) * tile_bytes
+        if self.index.get_objects(LIGHT_LAYER):
+            size += self.width * self.height * tile_bytes  # статическая карта света во всю карту
+        if self.index.properties.get(NAV_PROPERTY):
+            free_tiles = self.width * self.height - int(np.count_nonzero(self.index.grid.array & BLOCKED))
+            size += free_tiles * free_tiles * 3  # таблицы навигации: uint16 расстояние + uint8 направление
+        return size
+
+class MapCache:
+    """
+    LRU cache of LoadedMap objects keyed by map file path, limited by estimated memory.
+    The least recently used maps are evicted once max_bytes is exceeded
+    (the most recently used map is always kept).
+    Thread-safe: a map being loaded by another thread (MapPrefetcher) is waited for, not loaded twice.
+    """
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> LoadedMap, от старых к новым
+        self.loading = {}  # key -> threading.Event для карт, которые сейчас загружаются
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(filename):
+        return os.path.normcase(os.path.abspath(filename))
+
+    def get(self, filename, touch=True, headless=False):
+        """
+        Returns the LoadedMap for filename, loading it on a miss.
+        touch=False does not mark the map as recently used (used for prefetching):
+        a newly loaded map is placed just behind the most recently used one.
+        headless=True loads a missing map without the display (see LoadedMap);
+        a cached map is returned as is either way. A newly loaded map has its display-free data
+        (LoadedMap.prepare_data) ready before it is published.
+        """
+        key = self.make_key(filename)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    if touch:
+                        self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                event = self.loading.get(key)
+                if event is None:
+                    # Карту загружает этот поток
+                    self.loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Карту уже загружает другой поток — ждём его вместо повторной загрузки
+            event.wait()
+        try:
+            entry = LoadedMap(filename, headless=headless)
+            # Данные без дисплея (таблицы навигации) строятся до публикации карты:
+            # пока событие загрузки не выставлено, другой поток их не начнёт строить повторно
+            entry.prepare_data()
+            with self.lock:
+                current = next(reversed(self.entries), None) if not touch else None
+                self.entries[key] = entry
+                if current is not None:
+                    # Предзагруженная карта встаёт сразу за текущей, а не в начало очереди на вытеснение
+                    self.entries.move_to_end(current)
+                self.total_bytes += entry.size_bytes
+                self.evict()
+            return entry
+        finally:
+            with self.lock:
+                self.loading.pop(key).set()
+
+    def __contains__(self, filename):
+        with self.lock:
+            return self.make_key(filename) in self.entries
+
+    def evict(self):
+        """Drops least recently used maps until the cache fits into max_bytes. Call with the lock held."""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size_bytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+class MapPrefetcher:
+    """
+    Loads maps into the MapCache on a background thread,
+    so that a map transition finds its destination already decoded.
+    Maps are loaded headless, so only their display-free data is prepared there (by MapCache.get);
+    tile conversion and baking happen on the main thread on first use.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='map-prefetch', daemon=True)
+        self.thread.start()
+
+    def prefetch(self, filenames):
+        """Queues maps that are neither cached nor already queued."""
+        for filename in filenames:
+            key = self.cache.make_key(filename)
+            with self.lock:
+                if key in self.pending or filename in self.cache:
+                    continue
+                self.pending.add(key)
+            self.queue.put(filename)
+
+    def is_pending(self, filename):
+        with self.lock:
+            return self.cache.make_key(filename) in self.pending
+
+    def run(self):
+        while True:
+            filename = self.queue.get()
+            try:
+                self.cache.get(filename, touch=False, headless=True)
+            except Exception as e:
+                print(f"Ошибка предзагрузки карты {filename}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(self.cache.make_key(filename))
+
+
+_map_cache = None
+_map_prefetcher = None
+
+def get_map_cache():
+    """Returns the process-wide map cache."""
+    global _map_cache
+    if _map_cache is None:
+        _map_cache = MapCache()
+    return _map_cache
+
+def get_map_prefetcher():
+    """Returns the process-wide map prefetcher (starts its worker thread on first use)."""
+    global _map_prefetcher
+    if _map_prefetcher is None:
+        _map_prefetcher = MapPrefetcher(get_map_cache())
+    return _map_prefetcher
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import glob
+import struct
+import zlib
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import pygame
+from map_index import MapIndex
+from atlas import build_tile_atlas
+
+# Скомпилированная карта: maps/.compiled/<имя>.mapc
+# Формат: MAGIC, версия (uint16), длина заголовка (uint32), JSON-заголовок, zlib(двоичные блоки)
+MAGIC = b'BDMAP'
+FORMAT_VERSION = 4
+COMPILED_DIR = '.compiled'
+COMPILED_EXT = '.mapc'
+_HEADER = struct.Struct('<5sHI')
+
+def get_compiled_path(filename):
+    """maps/map1.tmx -> maps/.compiled/map1.mapc"""
+    folder, name = os.path.split(filename)
+    return os.path.join(folder, COMPILED_DIR, os.path.splitext(name)[0] + COMPILED_EXT)
+
+def get_map_dependencies(filename, tmx_data):
+    """
+    Returns the source files the map is built from: the .tmx, its external .tsx tilesets and tileset images.
+    Paths are relative to the folder of the .tmx.
+    """
+    folder = os.path.dirname(filename)
+    deps = [os.path.basename(filename)]
+    root = ElementTree.parse(filename).getroot()
+    for node in root.findall('tileset'):
+        source = node.get('source')
+        if source:
+            deps.append(source)
+    for tileset in tmx_data.tilesets:
+        if tileset.source and tileset.source not in deps:
+            deps.append(tileset.source)
+    return [dep for dep in deps if os.path.exists(os.path.join(folder, dep))]
+
+def save_compiled_map(loaded_map, dependencies):
+    """
+    Writes the compiled artifact for a map loaded from .tmx (LoadedMap with tmx_data).
+    """
+    path = get_compiled_path(loaded_map.filename)
+    folder = os.path.dirname(loaded_map.filename)
+    atlas, rects = build_tile_atlas(loaded_map.images)
+    blobs = []
+    payload = bytearray()
+
+    def add_blob(data):
+        blobs.append((len(payload), len(data)))
+        payload.extend(data)
+        return len(blobs) - 1
+
+    layers = []
+    for layer in loaded_map.layers:
+        gids = np.ascontiguousarray(layer['gids'])
+        layers.append({
+            'name': layer['name'],
+            'visible': layer['visible'],
+            'dynamic': layer['dynamic'],
+            'dtype': gids.dtype.str,
+            'shape': list(gids.shape),
+            'blob': add_blob(gids.tobytes())
+        })
+    header = {
+        'width': loaded_map.width,
+        'height': loaded_map.height,
+        'tile_width': loaded_map.tile_width,
+        'tile_height': loaded_map.tile_height,
+        'dependencies': {dep: os.path.getmtime(os.path.join(folder, dep)) for dep in dependencies},
+        'layers': layers,
+        'grid': add_blob(bytes(loaded_map.index.grid.cells)),
+        'index': loaded_map.index.to_dict(),
+        'atlas_size': list(atlas.get_size()),
+        'atlas': add_blob(pygame.image.tobytes(atlas, 'RGBA')),
+        'tile_rects': rects,
+        'blobs': blobs
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(zlib.compress(bytes(payload), 6))
+    os.replace(tmp_path, path)  # атомарная замена: не оставляем наполовину записанный файл
+    return path
+
+def load_compiled_map(filename):
+    """
+    Loads the compiled artifact of a map.
+    Returns a dict with keys: width, height, tile_width, tile_height, layers, index,
+    atlas (not converted, so no display is needed), tile_rects — or None if there is no artifact
+    or any source file is newer than it (then the map must be loaded through pytmx).
+    """
+    path = get_compiled_path(filename)
+    folder = os.path.dirname(filename)
+    try:
+        with open(path, 'rb') as f:
+            magic, version, header_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            for dep, mtime in header['dependencies'].items():
+                if os.path.getmtime(os.path.join(folder, dep)) > mtime:
+                    return None
+            payload = zlib.decompress(f.read())
+    except (OSError, ValueError, KeyError, struct.error, zlib.error):
+        return None
+
+    def get_blob(index):
+        offset, size = header['blobs'][index]
+        return payload[offset:offset + size]
+
+    layers = []
+    for layer in header['layers']:
+        gids = np.frombuffer(get_blob(layer['blob']), dtype=np.dtype(layer['dtype'])).reshape(layer['shape'])
+        layers.append({
+            'name': layer['name'],
+            'gids': gids,
+            'visible': layer['visible'],
+            'dynamic': layer['dynamic']
+        })
+    atlas = pygame.image.frombytes(get_blob(header['atlas']), tuple(header['atlas_size']), 'RGBA')
+    return {
+        'width': header['width'],
+        'height': header['height'],
+        'tile_width': header['tile_width'],
+        'tile_height': header['tile_height'],
+        'layers': layers,
+        'atlas': atlas,
+        'tile_rects': [tuple(rect) if rect else None for rect in header['tile_rects']],
+        'index': MapIndex.from_dict(header['index'], get_blob(header['grid']))
+    }
+
+def compile_all(maps_dir='maps'):
+    """Offline compile step: builds artifacts for every maps/*.tmx."""
+    from map_cache import LoadedMap
+    for filename in sorted(glob.glob(os.path.join(maps_dir, '*.tmx'))):
+        loaded_map = LoadedMap(filename, use_compiled=False)
+        path = save_compiled_map(loaded_map, loaded_map.dependencies)
+        print(f"{filename} -> {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    compile_all(sys.argv[1] if len(sys.argv) > 1 else 'maps')
@@ -0,0 +1,172 @@
+import pytmx
+import pygame
+from tmx_loader import build_obstacle_set
+from occupancy import OccupancyGrid, TRIGGER
+from visibility import WallSegments
+
+class MapIndex:
+    """
+    Everything derived from the map's object layers, built in a single pass over tmx_data.layers:
+    collision rects and the occupancy grid, the trigger table, enemy spawns
+    and the objects of any other object layer with their typed properties, plus the map's own properties.
+    Layers follow the same rules as the tmx_loader getters:
+    the first object layer is the collision layer, the first 'trigg' layer holds triggers,
+    the first 'enem' layer holds enemies.
+    """
+    def __init__(self, width, height, tile_width, tile_height):
+        self.width = width  # размер карты в тайлах
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.collision_rects = []
+        self.grid = OccupancyGrid(width, height)  # флаги клеток: стены (BLOCKED) и триггеры (TRIGGER)
+        self.walls = None  # WallSegments: рёбра стен для полигона видимости
+        self.triggers = []  # dict: rect, dest_map, dest_x, dest_y, properties
+        self.trigger_buckets = {}  # (tx, ty) -> [индекс триггера]
+        self.enemies = []  # dict: name, x, y, width, height, properties
+        self.objects = {}  # имя слоя -> [dict: name, type, x, y, width, height, properties]
+        self.properties = {}  # свойства самой карты
+
+    @classmethod
+    def from_tmx(cls, tmx_data):
+        index = cls(tmx_data.width, tmx_data.height, tmx_data.tilewidth, tmx_data.tileheight)
+        index.properties = dict(tmx_data.properties)
+        collision_done = triggers_done = enemies_done = False
+        for layer in tmx_data.layers:
+            if not isinstance(layer, pytmx.TiledObjectGroup):
+                continue
+            is_collision = not collision_done
+            is_triggers = layer.name == 'trigg' and not triggers_done
+            is_enemies = layer.name == 'enem' and not enemies_done
+            collision_done = True
+            triggers_done = triggers_done or is_triggers
+            enemies_done = enemies_done or is_enemies
+            records = index.objects.setdefault(layer.name, [])
+            for obj in layer:
+                properties = dict(obj.properties)
+                if is_collision:
+                    index.collision_rects.append(pygame.Rect(obj.x, obj.y, obj.width, obj.height))
+                if is_triggers:
+                    index.triggers.append({
+                        "rect": pygame.Rect(obj.x, obj.y, obj.width, obj.height),
+                        "dest_map": getattr(obj, "name", None),
+                        "dest_x": properties.get("dest_x"),
+                        "dest_y": properties.get("dest_y"),
+                        "properties": properties
+                    })
+                if is_enemies:
+                    index.enemies.append({
+                        'name': getattr(obj, 'name', None),
+                        'x': obj.x,
+                        'y': obj.y,
+                        'width': obj.width,
+                        'height': obj.height,
+                        'properties': properties
+                    })
+                records.append({
+                    'name': getattr(obj, 'name', None),
+                    'type': getattr(obj, 'type', None),
+                    'x': obj.x,
+                    'y': obj.y,
+                    'width': obj.width,
+                    'height': obj.height,
+                    'properties': properties
+                })
+        index.build()
+        return index
+
+    def build(self, cells=None):
+        """Builds the derived lookups from the loaded records (the occupancy grid unless its cells are given)."""
+        # Пространственный хеш триггеров: тайл -> индексы триггеров, покрывающих его (по порядку в списке)
+        self.trigger_buckets = {}
+        for i, trig in enumerate(self.triggers):
+            left, top, right, bottom = self._tile_span(trig["rect"])
+            for ty in range(top, bottom + 1):
+                for tx in range(left, right + 1):
+                    self.trigger_buckets.setdefault((tx, ty), []).append(i)
+        if cells is not None:
+            self.grid = OccupancyGrid.from_bytes(cells, self.width, self.height)
+        else:
+            obstacles = build_obstacle_set(self.collision_rects, self.tile_width, self.tile_height)
+            self.grid = OccupancyGrid.from_tiles(obstacles, self.width, self.height)
+            for tile in self.trigger_buckets:
+                self.grid.set_flag(tile[0], tile[1], TRIGGER)
+        self.grid.label_regions()
+        self.walls = WallSegments(self.grid, self.tile_width, self.tile_height)
+
+    def to_dict(self):
+        """JSON-compatible form of the index (used by map_compiler)."""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'tile_width': self.tile_width,
+            'tile_height': self.tile_height,
+            'collision_rects': [list(rect) for rect in self.collision_rects],
+            'triggers': [dict(trig, rect=list(trig['rect'])) for trig in self.triggers],
+            'enemies': self.enemies,
+            'objects': self.objects,
+            'properties': self.properties
+        }
+
+    @classmethod
+    def from_dict(cls, data, cells=None):
+        index = cls(data['width'], data['height'], data['tile_width'], data['tile_height'])
+        index.collision_rects = [pygame.Rect(rect) for rect in data['collision_rects']]
+        index.triggers = [dict(trig, rect=pygame.Rect(trig['rect'])) for trig in data['triggers']]
+        index.enemies = data['enemies']
+        index.objects = data['objects']
+        index.properties = data['properties']
+        index.build(cells)
+        return index
+
+    def trigger_tile(self, trig):
+        """Tile (tx, ty) of the trigger's top-left corner."""
+        rect = trig["rect"]
+        return (rect.x // self.tile_width, rect.y // self.tile_height)
+
+    def _tile_span(self, rect):
+        """Inclusive tile range (left, top, right, bottom) covered by a pixel rect (at least one tile)."""
+        left = rect.left // self.tile_width
+        top = rect.top // self.tile_height
+        right = max(rect.left, rect.right - 1) // self.tile_width
+        bottom = max(rect.top, rect.bottom - 1) // self.tile_height
+        return left, top, right, bottom
+
+    def triggers_at(self, tx, ty):
+        """Triggers whose rect overlaps tile (tx, ty), in map order."""
+        indices = self.trigger_buckets.get((tx, ty))
+        if not indices:
+            return []
+        tile_rect = pygame.Rect(tx * self.tile_width, ty * self.tile_height, self.tile_width, self.tile_height)
+        return [self.triggers[i] for i in indices if tile_rect.colliderect(self.triggers[i]["rect"])]
+
+    def triggers_in_rect(self, rect):
+        """
+        Triggers lying on the tiles covered by a pixel rect, in map order.
+        Tile-granular: a trigger sharing a tile with rect is returned even if the rects don't overlap.
+        """
+        left, top, right, bottom = self._tile_span(rect)
+        found = set()
+        if len(self.trigger_buckets) < (right - left + 1) * (bottom - top + 1):
+            # занятых тайлов меньше, чем тайлов в области (обычно для вида всего экрана)
+            for (tx, ty), indices in self.trigger_buckets.items():
+                if left <= tx <= right and top <= ty <= bottom:
+                    found.update(indices)
+        else:
+            for ty in range(top, bottom + 1):
+                for tx in range(left, right + 1):
+                    indices = self.trigger_buckets.get((tx, ty))
+                    if indices:
+                        found.update(indices)
+        return [self.triggers[i] for i in sorted(found)]
+
+    def find_trigger(self, predicate):
+        """First trigger for which predicate(trig) is true, or None."""
+        for trig in self.triggers:
+            if predicate(trig):
+                return trig
+        return None
+
+    def get_objects(self, layer_name):
+        """Objects of the given object layer (empty list if there is no such layer)."""
+        return self.objects.get(layer_name, [])
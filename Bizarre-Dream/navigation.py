@@ -0,0 +1,335 @@
+import os
+import struct
+import zlib
+from array import array
+import numpy as np
+from occupancy import BLOCKED, NO_REGION
+from map_compiler import get_compiled_path
+
+UNREACHABLE = -1
+
+# Соседи по 4 направлениям: (dx, dy)
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+class FlowField:
+    """
+    Shared chase field toward one goal tile (the player tile) over the OccupancyGrid.
+    One BFS from the goal fills dist (steps to the goal, UNREACHABLE where it can't be reached)
+    and next (flat index of the neighbour one step closer), so every enemy reads its next step in O(1).
+    Recomputed only when the goal tile or the grid's obstacles change; all enemies of a map share one field.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self.goal = None
+        self.version = None  # версия сетки, по которой построено поле
+        size = grid.width * grid.height
+        self.dist = array('i', [UNREACHABLE]) * size
+        self.next = array('i', [UNREACHABLE]) * size
+
+    def update(self, goal):
+        """Rebuilds the field if the goal tile or the obstacles changed. Cheap to call every frame from every enemy."""
+        if goal != self.goal or self.grid.version != self.version:
+            self._build(goal)
+
+    def invalidate(self):
+        """Forces a rebuild on the next update."""
+        self.goal = None
+
+    def _build(self, goal):
+        grid = self.grid
+        width = grid.width
+        height = grid.height
+        cells = grid.cells
+        size = width * height
+        dist = array('i', [UNREACHABLE]) * size
+        nxt = array('i', [UNREACHABLE]) * size
+        self.goal = goal
+        self.version = grid.version
+        gx, gy = goal
+        if grid.region(gx, gy) != NO_REGION:
+            start = gy * width + gx
+            dist[start] = 0
+            nxt[start] = start
+            frontier = [start]
+            d = 0
+            while frontier:
+                d += 1
+                new_frontier = []
+                append = new_frontier.append
+                for current in frontier:
+                    x = current % width
+                    # Соседи в порядке NEIGHBOURS; выход за край карты — стена
+                    if x > 0:
+                        n = current - 1
+                        if dist[n] < 0 and not cells[n] & BLOCKED:
+                            dist[n] = d
+                            nxt[n] = current
+                            append(n)
+                    if x < width - 1:
+                        n = current + 1
+                        if dist[n] < 0 and not cells[n] & BLOCKED:
+                            dist[n] = d
+                            nxt[n] = current
+                            append(n)
+                    if current >= width:
+                        n = current - width
+                        if dist[n] < 0 and not cells[n] & BLOCKED:
+                            dist[n] = d
+                            nxt[n] = current
+                            append(n)
+                    if current < size - width:
+                        n = current + width
+                        if dist[n] < 0 and not cells[n] & BLOCKED:
+                            dist[n] = d
+                            nxt[n] = current
+                            append(n)
+                frontier = new_frontier
+        self.dist = dist
+        self.next = nxt
+
+    def distance(self, tile):
+        """Steps from tile to the goal, UNREACHABLE if there is no way (or the tile is outside the map)."""
+        tx, ty = tile
+        if self.grid.in_bounds(tx, ty):
+            return self.dist[ty * self.grid.width + tx]
+        return UNREACHABLE
+
+    def next_step(self, tile, occupied=None):
+        """
+        Tile one step closer to the goal, or None if tile is the goal or unreachable.
+        With occupied (set of tiles), an occupied step is replaced by another free neighbour
+        just as close to the goal; None if all of them are occupied (wait).
+        """
+        tx, ty = tile
+        width = self.grid.width
+        if not self.grid.in_bounds(tx, ty):
+            return None
+        index = ty * width + tx
+        d = self.dist[index]
+        if d <= 0:
+            return None
+        n = self.next[index]
+        step = (n % width, n // width)
+        if not occupied or step not in occupied or step == self.goal:
+            return step
+        dist = self.dist
+        for dx, dy in NEIGHBOURS:
+            nx, ny = tx + dx, ty + dy
+            if self.grid.in_bounds(nx, ny) and dist[ny * width + nx] == d - 1 and (nx, ny) not in occupied:
+                return (nx, ny)
+        return None
+
+class EnemyOccupancy:
+    """
+    Which tiles are taken by enemies, shared by all enemies of a map.
+    Each enemy registers its tile once and reports when it enters another tile,
+    so queries never walk the enemy list. counts maps (tx, ty) to the number of enemies on it.
+    """
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, tile):
+        self.counts[tile] = self.counts.get(tile, 0) + 1
+
+    def remove(self, tile):
+        count = self.counts.get(tile, 0) - 1
+        if count > 0:
+            self.counts[tile] = count
+        else:
+            self.counts.pop(tile, None)
+
+    def move(self, old_tile, new_tile):
+        if old_tile != new_tile:
+            self.remove(old_tile)
+            self.add(new_tile)
+
+    def others(self, own_tile):
+        """Live set-like view of the tiles taken by enemies other than the one standing on own_tile."""
+        return OccupiedByOthers(self.counts, own_tile)
+
+class OccupiedByOthers:
+    """Supports `tile in view` and iteration, as the occupied sets of next_step and astar expect."""
+    __slots__ = ('counts', 'own_tile')
+
+    def __init__(self, counts, own_tile):
+        self.counts = counts
+        self.own_tile = own_tile
+
+    def __contains__(self, tile):
+        count = self.counts.get(tile, 0)
+        return count > 1 or (count == 1 and tile != self.own_tile)
+
+    def __iter__(self):
+        own_tile = self.own_tile
+        return (tile for tile, count in self.counts.items() if count > 1 or tile != own_tile)
+
+    def __bool__(self):
+        return any(True for _ in self)
+
+# Таблицы всех пар (NavTable): кэш на диске рядом со скомпилированной картой, maps/.compiled/<имя>.navc
+# Формат: MAGIC, версия, ширина, высота, crc32 маски стен, zlib(слоты клеток, расстояния, направления)
+NAV_MAGIC = b'BDNAV'
+NAV_FORMAT_VERSION = 1
+NAV_EXT = '.navc'
+NAV_PROPERTY = 'nav_table'  # булево свойство карты в Tiled, включающее таблицы
+NO_DISTANCE = 0xFFFF
+NO_STEP = 255
+_NAV_HEADER = struct.Struct('<5sHHHI')
+
+class NavTable:
+    """
+    All-pairs chase tables of a small map: for every pair of free tiles (goal, tile)
+    the distance and the direction (index into NEIGHBOURS) of the next step toward the goal.
+    Same interface as FlowField, but update is free and next_step is a table lookup.
+    Built from one FlowField BFS per goal; stale once the grid's obstacles change,
+    then the queries fall back to a FlowField.
+    """
+    def __init__(self, grid, slots, dist, directions):
+        self.grid = grid
+        self.version = grid.version
+        self.slots = slots  # плоский индекс клетки для каждого слота
+        slot_of = np.full(grid.width * grid.height, -1, dtype=np.int32)
+        slot_of[slots] = np.arange(len(slots), dtype=np.int32)
+        self.slot_of = slot_of.tolist()
+        self.dist = dist  # [слот цели, слот клетки] -> шагов, NO_DISTANCE если недостижимо
+        self.directions = directions  # [слот цели, слот клетки] -> индекс в NEIGHBOURS, NO_STEP у цели
+        self.goal = None
+        self._goal_slot = -1
+        # Строки таблиц для текущей цели как обычные последовательности: чтение элемента numpy-массива медленнее
+        self._dist_row = None
+        self._direction_row = None
+        self.fallback = None
+
+    @classmethod
+    def build(cls, grid):
+        slots = np.flatnonzero((grid.array.ravel() & BLOCKED) == 0).astype(np.int32)
+        count = len(slots)
+        width = grid.width
+        dist = np.full((count, count), NO_DISTANCE, dtype=np.uint16)
+        directions = np.full((count, count), NO_STEP, dtype=np.uint8)
+        offset_to_direction = np.full(2 * width + 1, NO_STEP, dtype=np.uint8)
+        for k, (dx, dy) in enumerate(NEIGHBOURS):
+            offset_to_direction[dy * width + dx + width] = k
+        field = FlowField(grid)
+        for goal_slot, goal in enumerate(slots.tolist()):
+            field._build((goal % width, goal // width))
+            row = np.frombuffer(field.dist, dtype=np.int32)[slots]
+            step = np.frombuffer(field.next, dtype=np.int32)[slots]
+            reached = row > 0
+            dist[goal_slot, row >= 0] = row[row >= 0]
+            directions[goal_slot, reached] = offset_to_direction[step[reached] - slots[reached] + width]
+        return cls(grid, slots, dist, directions)
+
+    @property
+    def size_bytes(self):
+        return self.dist.nbytes + self.directions.nbytes
+
+    def update(self, goal):
+        if goal != self.goal:
+            self.goal = goal
+            self._goal_slot = self._slot(goal)
+            if self._goal_slot >= 0:
+                self._dist_row = self.dist[self._goal_slot].tolist()
+                self._direction_row = self.directions[self._goal_slot].tobytes()
+        self._stale_field()
+
+    def _stale_field(self):
+        """FlowField toward the goal once the obstacles changed (the tables are stale then), else None."""
+        if self.grid.version == self.version:
+            return None
+        if self.fallback is None:
+            self.fallback = FlowField(self.grid)
+        if self.goal is not None:
+            self.fallback.update(self.goal)
+        return self.fallback
+
+    def _slot(self, tile):
+        tx, ty = tile
+        if self.grid.in_bounds(tx, ty):
+            return self.slot_of[ty * self.grid.width + tx]
+        return -1
+
+    def distance(self, tile):
+        """Steps from tile to the goal, UNREACHABLE if there is no way."""
+        field = self._stale_field()
+        if field is not None:
+            return field.distance(tile)
+        slot = self._slot(tile)
+        if slot < 0 or self._goal_slot < 0:
+            return UNREACHABLE
+        d = self._dist_row[slot]
+        return UNREACHABLE if d == NO_DISTANCE else d
+
+    def next_step(self, tile, occupied=None):
+        """Same as FlowField.next_step, read from the tables."""
+        field = self._stale_field()
+        if field is not None:
+            return field.next_step(tile, occupied)
+        slot = self._slot(tile)
+        if slot < 0 or self._goal_slot < 0:
+            return None
+        direction = self._direction_row[slot]
+        if direction == NO_STEP:
+            return None
+        tx, ty = tile
+        dx, dy = NEIGHBOURS[direction]
+        step = (tx + dx, ty + dy)
+        if not occupied or step not in occupied or step == self.goal:
+            return step
+        row = self._dist_row
+        d = row[slot]
+        for dx, dy in NEIGHBOURS:
+            n = (tx + dx, ty + dy)
+            n_slot = self._slot(n)
+            if n_slot >= 0 and row[n_slot] == d - 1 and n not in occupied:
+                return n
+        return None
+
+def get_nav_table_path(filename):
+    """maps/map1.tmx -> maps/.compiled/map1.navc"""
+    return os.path.splitext(get_compiled_path(filename))[0] + NAV_EXT
+
+def _grid_checksum(grid):
+    return zlib.crc32(((grid.array & BLOCKED) != 0).tobytes())
+
+def save_nav_table(filename, table):
+    path = get_nav_table_path(filename)
+    grid = table.grid
+    payload = table.slots.astype('<i4').tobytes() + table.dist.astype('<u2').tobytes() + table.directions.tobytes()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_NAV_HEADER.pack(NAV_MAGIC, NAV_FORMAT_VERSION, grid.width, grid.height, _grid_checksum(grid)))
+        f.write(zlib.compress(payload, 6))
+    os.replace(tmp_path, path)
+    return path
+
+def load_nav_table(filename, grid):
+    """Cached tables of the map, or None if there are none or they were built for other walls."""
+    try:
+        with open(get_nav_table_path(filename), 'rb') as f:
+            magic, version, width, height, checksum = _NAV_HEADER.unpack(f.read(_NAV_HEADER.size))
+            if (magic != NAV_MAGIC or version != NAV_FORMAT_VERSION or (width, height) != (grid.width, grid.height)
+                    or checksum != _grid_checksum(grid)):
+                return None
+            payload = zlib.decompress(f.read())
+    except (OSError, struct.error, zlib.error):
+        return None
+    count = int(np.count_nonzero((grid.array & BLOCKED) == 0))
+    if len(payload) != count * 4 + count * count * 3:
+        return None
+    slots = np.frombuffer(payload, dtype='<i4', count=count).astype(np.int32)
+    dist = np.frombuffer(payload, dtype='<u2', count=count * count, offset=count * 4).reshape(count, count)
+    directions = np.frombuffer(payload, dtype=np.uint8, offset=count * 4 + count * count * 2).reshape(count, count)
+    return NavTable(grid, slots, dist, directions)
+
+def get_nav_table(filename, grid):
+    """Tables of the map from the disk cache, built and cached on first use."""
+    table = load_nav_table(filename, grid)
+    if table is None:
+        table = NavTable.build(grid)
+        try:
+            save_nav_table(filename, table)
+        except OSError as e:
+            print(f"Не удалось сохранить таблицы навигации {filename}: {e}")
+    return table
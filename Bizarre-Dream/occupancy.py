@@ -0,0 +1,160 @@
+from array import array
+import numpy as np
+
+# Флаги клеток
+BLOCKED = 1  # стена/препятствие из слоя коллизий
+TRIGGER = 2  # под клеткой есть триггер
+
+NO_REGION = -1  # метка области для стен и клеток вне карты
+
+class OccupancyGrid:
+    """
+    Compact per-tile flag grid of the map (one byte per tile).
+    cells is a flat bytearray indexed ty * width + tx; array is a numpy [ty, tx] view of the same memory
+    for batched queries. Tiles outside the map count as blocked when outside_blocked is true.
+    Hot loops may read cells/width/height directly instead of calling the methods.
+    version grows whenever a tile's BLOCKED flag changes; the connected regions of free tiles
+    (4-neighbour) are relabelled lazily on the first query after a change.
+    """
+    def __init__(self, width, height, outside_blocked=True):
+        self.width = width
+        self.height = height
+        self.outside_blocked = outside_blocked
+        self.cells = bytearray(width * height)
+        self.array = np.frombuffer(self.cells, dtype=np.uint8).reshape(height, width)
+        self.version = 0
+        self.labels = None  # номер области для каждой клетки (NO_REGION у стен)
+        self.region_count = 0
+        self._labels_version = None
+
+    @classmethod
+    def from_tiles(cls, tiles, width, height, flag=BLOCKED, outside_blocked=True):
+        """Grid with flag set on every (tx, ty) in tiles (tiles outside the map are ignored)."""
+        grid = cls(width, height, outside_blocked)
+        for tx, ty in tiles:
+            grid.set_flag(tx, ty, flag)
+        return grid
+
+    @classmethod
+    def from_bytes(cls, data, width, height, outside_blocked=True):
+        """Grid from raw cells (bytes of another grid's cells, e.g. from a compiled map)."""
+        grid = cls(width, height, outside_blocked)
+        grid.cells[:] = data
+        return grid
+
+    def in_bounds(self, tx, ty):
+        return 0 <= tx < self.width and 0 <= ty < self.height
+
+    def get(self, tx, ty):
+        """Flags of the tile (0 outside the map)."""
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return self.cells[ty * self.width + tx]
+        return 0
+
+    def set_flag(self, tx, ty, flag):
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            index = ty * self.width + tx
+            if flag & BLOCKED and not self.cells[index] & BLOCKED:
+                self.version += 1
+            self.cells[index] |= flag
+
+    def clear_flag(self, tx, ty, flag):
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            index = ty * self.width + tx
+            if flag & BLOCKED and self.cells[index] & BLOCKED:
+                self.version += 1
+            self.cells[index] &= ~flag & 0xFF
+
+    def is_blocked(self, tx, ty):
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return self.cells[ty * self.width + tx] & BLOCKED != 0
+        return self.outside_blocked
+
+    def __contains__(self, tile):
+        # Совместимость с проверкой (tx, ty) in obstacles
+        return self.is_blocked(tile[0], tile[1])
+
+    def rect_blocked(self, left, top, right, bottom):
+        """True if any tile in the inclusive tile range [left..right] x [top..bottom] is blocked."""
+        if left < 0 or top < 0 or right >= self.width or bottom >= self.height:
+            if self.outside_blocked:
+                return True
+            left, top = max(left, 0), max(top, 0)
+            right, bottom = min(right, self.width - 1), min(bottom, self.height - 1)
+        cells = self.cells
+        width = self.width
+        for ty in range(top, bottom + 1):
+            row = ty * width
+            for tx in range(left, right + 1):
+                if cells[row + tx] & BLOCKED:
+                    return True
+        return False
+
+    def area_blocked(self, px, py, tile_width, tile_height):
+        """
+        True if a tile-sized box with top-left corner at pixel (px, py) touches a blocked tile
+        (the collision test of Player, Enemy and GameState).
+        """
+        left = int(px / tile_width)
+        right = int((px + tile_width - 1) / tile_width)
+        top = int(py / tile_height)
+        bottom = int((py + tile_height - 1) / tile_height)
+        return self.rect_blocked(left, top, right, bottom)
+
+    def blocked_many(self, txs, tys):
+        """Batched query: numpy bool array, True where (txs[i], tys[i]) is blocked."""
+        txs = np.asarray(txs, dtype=np.intp)
+        tys = np.asarray(tys, dtype=np.intp)
+        inside = (txs >= 0) & (txs < self.width) & (tys >= 0) & (tys < self.height)
+        result = np.full(txs.shape, self.outside_blocked, dtype=bool)
+        result[inside] = (self.array[tys[inside], txs[inside]] & BLOCKED) != 0
+        return result
+
+    def blocked_tiles(self):
+        """Set of (tx, ty) of all blocked tiles inside the map."""
+        ys, xs = np.nonzero(self.array & BLOCKED)
+        return set(zip(xs.tolist(), ys.tolist()))
+
+    def label_regions(self):
+        """
+        Labels the connected regions of free tiles (flood fill over the 4 neighbours) if the grid
+        changed since the last labelling. Called at map load; queries call it on demand.
+        """
+        if self._labels_version == self.version:
+            return self.labels
+        width = self.width
+        size = width * self.height
+        cells = self.cells
+        labels = array('i', [NO_REGION]) * size
+        count = 0
+        for seed in range(size):
+            if labels[seed] != NO_REGION or cells[seed] & BLOCKED:
+                continue
+            labels[seed] = count
+            stack = [seed]
+            pop = stack.pop
+            push = stack.append
+            while stack:
+                current = pop()
+                x = current % width
+                for n in (current - 1 if x > 0 else -1, current + 1 if x < width - 1 else -1,
+                          current - width, current + width):
+                    if 0 <= n < size and labels[n] == NO_REGION and not cells[n] & BLOCKED:
+                        labels[n] = count
+                        push(n)
+            count += 1
+        self.labels = labels
+        self.region_count = count
+        self._labels_version = self.version
+        return labels
+
+    def region(self, tx, ty):
+        """Region label of a tile, NO_REGION for walls and tiles outside the map."""
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return self.label_regions()[ty * self.width + tx]
+        return NO_REGION
+
+    def connected(self, a, b):
+        """True if free tiles a and b ((tx, ty)) are in the same region, i.e. a path between them exists."""
+        region = self.region(a[0], a[1])
+        return region != NO_REGION and region == self.region(b[0], b[1])
@@ -0,0 +1,250 @@
+import heapq
+from array import array
+from collections import deque
+from occupancy import BLOCKED
+
+# Поиск без занятых тайлов: 'astar' или 'jps'. По bench_pathfinding.py JPS быстрее только на лабиринте map1
+# (0.23 против 0.33 мс на путь), на открытых map3, maph, mapl медленнее A* (0.27/0.22/0.28 против 0.19/0.13/0.21 мс)
+PATH_SEARCH = 'astar'
+
+class GridPathfinder:
+    """
+    4-connected shortest paths over an OccupancyGrid (uniform cost, tiles outside the map are walls).
+    Search state lives in flat arrays indexed ty * width + tx that are reused between searches:
+    a generation stamp marks which entries belong to the current search, so nothing is cleared.
+    jps — Jump Point Search (horizontal scans, vertical moves branch sideways), astar — plain A*
+    that can also avoid dynamic occupied tiles. Paths are deques of (tx, ty) from start to goal.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        size = grid.width * grid.height
+        self.g = array('i', [0]) * size
+        self.parent = array('i', [0]) * size
+        self.seen = array('I', [0]) * size  # поколение, в котором клетка открыта
+        self.closed = array('I', [0]) * size  # поколение, в котором клетка закрыта
+        self.generation = 0
+        width = grid.width
+        # Смещения соседей в плоском индексе: (смещение, dx, dy)
+        self.offsets = ((-1, -1, 0), (1, 1, 0), (-width, 0, -1), (width, 0, 1))
+        self.expanded = 0  # раскрытых узлов в последнем поиске (для бенчмарка)
+
+    def find_path(self, start, goal, occupied=None):
+        """A* avoiding occupied tiles; without them the search chosen by PATH_SEARCH."""
+        if not occupied and PATH_SEARCH == 'jps':
+            return self.jps(start, goal)
+        return self.astar(start, goal, occupied)
+
+    def _endpoints(self, start, goal):
+        """
+        Flat indices of start and goal, or None if either is outside the map or blocked,
+        or if they lie in different regions of the grid — then no search is run at all.
+        """
+        grid = self.grid
+        if not grid.connected(start, goal):
+            return None
+        return start[1] * grid.width + start[0], goal[1] * grid.width + goal[0]
+
+    def _next_generation(self):
+        self.generation += 1
+        if self.generation >= 0xFFFFFFFF:
+            # переполнение счётчика: сбрасываем метки
+            self.seen = array('I', [0]) * len(self.seen)
+            self.closed = array('I', [0]) * len(self.closed)
+            self.generation = 1
+        return self.generation
+
+    def _build_path(self, end):
+        """Deque of tiles from the search start to end, filling the straight runs between jump points."""
+        width = self.grid.width
+        parent = self.parent
+        path = deque()
+        current = end
+        while True:
+            x, y = current % width, current // width
+            path.appendleft((x, y))
+            previous = parent[current]
+            if previous < 0:
+                return path
+            px, py = previous % width, previous // width
+            # промежуточные тайлы прямого отрезка (у A* соседние, отрезок пустой)
+            step_x = (px > x) - (px < x)
+            step_y = (py > y) - (py < y)
+            x += step_x
+            y += step_y
+            while (x, y) != (px, py):
+                path.appendleft((x, y))
+                x += step_x
+                y += step_y
+            current = previous
+
+    def astar(self, start, goal, occupied=None):
+        """A* over array-backed state; occupied tiles (except the goal) are treated as walls."""
+        endpoints = self._endpoints(start, goal)
+        if endpoints is None:
+            return deque()
+        s, t = endpoints
+        width = self.grid.width
+        size = len(self.g)
+        cells = self.grid.cells
+        g = self.g
+        parent = self.parent
+        seen = self.seen
+        closed = self.closed
+        gen = self._next_generation()
+        avoid = set()
+        if occupied:
+            avoid = {ty * width + tx for tx, ty in occupied if self.grid.in_bounds(tx, ty)}
+            avoid.discard(t)
+        gx, gy = goal
+        seen[s] = gen
+        g[s] = 0
+        parent[s] = -1
+        open_set = [(abs(start[0] - gx) + abs(start[1] - gy), s)]
+        expanded = 0
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        offsets = self.offsets
+        while open_set:
+            _, current = heappop(open_set)
+            if closed[current] == gen:
+                continue
+            if current == t:
+                self.expanded = expanded
+                return self._build_path(t)
+            closed[current] = gen
+            expanded += 1
+            cx = current % width
+            cy = current // width
+            tentative = g[current] + 1
+            for offset, dx, dy in offsets:
+                # выход за край строки/карты
+                if (dx < 0 and cx == 0) or (dx > 0 and cx == width - 1):
+                    continue
+                n = current + offset
+                if n < 0 or n >= size or cells[n] & BLOCKED or closed[n] == gen or n in avoid:
+                    continue
+                if seen[n] != gen or tentative < g[n]:
+                    seen[n] = gen
+                    g[n] = tentative
+                    parent[n] = current
+                    heappush(open_set, (tentative + abs(cx + dx - gx) + abs(cy + dy - gy), n))
+        self.expanded = expanded
+        return deque()
+
+    def _jump_horizontal(self, x, y, dx, goal):
+        """Scans from (x, y) in direction dx; returns the first jump point (flat index) or -1."""
+        grid = self.grid
+        width = grid.width
+        height = grid.height
+        cells = grid.cells
+        row = y * width
+        has_up = y > 0
+        has_down = y < height - 1
+        while True:
+            nx = x + dx
+            if nx < 0 or nx >= width or cells[row + nx] & BLOCKED:
+                return -1
+            n = row + nx
+            if n == goal:
+                return n
+            # Вынужденный сосед: сверху/снизу свободно, а у предыдущей клетки там стена
+            if has_up and not cells[n - width] & BLOCKED and cells[row - width + x] & BLOCKED:
+                return n
+            if has_down and not cells[n + width] & BLOCKED and cells[row + width + x] & BLOCKED:
+                return n
+            x = nx
+
+    def _jump_vertical(self, x, y, dy, goal):
+        """Scans from (x, y) in direction dy; stops where a horizontal scan finds a jump point."""
+        grid = self.grid
+        width = grid.width
+        height = grid.height
+        cells = grid.cells
+        while True:
+            ny = y + dy
+            if ny < 0 or ny >= height or cells[ny * width + x] & BLOCKED:
+                return -1
+            n = ny * width + x
+            if n == goal:
+                return n
+            if self._jump_horizontal(x, ny, 1, goal) >= 0 or self._jump_horizontal(x, ny, -1, goal) >= 0:
+                return n
+            y = ny
+
+    def jps(self, start, goal):
+        """Jump Point Search for 4-connected uniform grids; same path lengths as astar without occupied."""
+        endpoints = self._endpoints(start, goal)
+        if endpoints is None:
+            return deque()
+        s, t = endpoints
+        grid = self.grid
+        width = grid.width
+        height = grid.height
+        cells = grid.cells
+        g = self.g
+        parent = self.parent
+        seen = self.seen
+        closed = self.closed
+        gen = self._next_generation()
+        gx, gy = goal
+        seen[s] = gen
+        g[s] = 0
+        parent[s] = -1
+        open_set = [(abs(start[0] - gx) + abs(start[1] - gy), s)]
+        expanded = 0
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        jump_horizontal = self._jump_horizontal
+        jump_vertical = self._jump_vertical
+        while open_set:
+            _, current = heappop(open_set)
+            if closed[current] == gen:
+                continue
+            if current == t:
+                self.expanded = expanded
+                return self._build_path(t)
+            closed[current] = gen
+            expanded += 1
+            cx = current % width
+            cy = current // width
+            p = parent[current]
+            # Направления поиска из узла: из старта — все; после вертикального хода — дальше по вертикали
+            # и в обе стороны; после горизонтального — дальше по горизонтали и вынужденные вертикали
+            if p < 0:
+                horizontal = (-1, 1)
+                vertical = (-1, 1)
+            elif p // width == cy:
+                dx = 1 if cx > p % width else -1
+                horizontal = (dx,)
+                vertical = []
+                if cy > 0 and not cells[current - width] & BLOCKED and cells[current - width - dx] & BLOCKED:
+                    vertical.append(-1)
+                if cy < height - 1 and not cells[current + width] & BLOCKED and cells[current + width - dx] & BLOCKED:
+                    vertical.append(1)
+            else:
+                horizontal = (-1, 1)
+                vertical = (1 if cy > p // width else -1,)
+            successors = [jump_horizontal(cx, cy, dx, t) for dx in horizontal]
+            successors += [jump_vertical(cx, cy, dy, t) for dy in vertical]
+            for n in successors:
+                if n < 0 or closed[n] == gen:
+                    continue
+                nx = n % width
+                ny = n // width
+                tentative = g[current] + abs(nx - cx) + abs(ny - cy)
+                if seen[n] != gen or tentative < g[n]:
+                    seen[n] = gen
+                    g[n] = tentative
+                    parent[n] = current
+                    heappush(open_set, (tentative + abs(nx - gx) + abs(ny - gy), n))
+        self.expanded = expanded
+        return deque()
+
+_pathfinder = None
+
+def get_pathfinder(grid):
+    """Shared pathfinder of the current map grid (recreated when the grid changes)."""
+    global _pathfinder
+    if _pathfinder is None or _pathfinder.grid is not grid:
+        _pathfinder = GridPathfinder(grid)
+    return _pathfinder
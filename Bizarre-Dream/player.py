@@ -2,14 +2,33 @@ import pygame
 import math
 import controls
 from audio import get_audio_manager
+from raycast import cast_ray, cast_rays_batch, ray_box_distance
+from visibility import WallSegments, visibility_sweep, HIT_NONE
+from lighting import get_light_compositor
+
+# Фонарик
+FOV_ANGLE = 100  # угол сектора, градусы
+FOV_RADIUS = 400  # дальность, px
+FOV_RAYS = 40  # число промежутков между лучами (лучей на один больше)
+EXTRA_LIGHT_TILES = 1  # насколько тайлов свет заходит за точку попадания
+# Способ расчёта сектора: 'polygon' — точный полигон видимости по рёбрам стен,
+# 'dda' — веер из FOV_RAYS лучей по одному, 'numpy' — тот же веер одним пакетом.
+# По умолчанию 'dda': на картах игры он быстрее (0.15-0.28 мс на пересчёт против 0.17-0.42 мс у 'polygon',
+# у которого время уходит на накладные расходы numpy) и пересчитывается реже (FOV_ANGLE_THRESHOLD).
+# 'polygon' даёт точный контур из немногих вершин (4-10 против 42) — для крупных карт или широкого луча.
+FOV_BACKENDS = ('polygon', 'dda', 'numpy')
+FOV_BACKEND = 'dda'
+FOV_ANGLE_THRESHOLD = 5  # для 'dda': пересчёт только при повороте больше чем на столько градусов
+FOV_ANGLE_EPSILON = 0.25  # для остальных: поворот меньше этого (<2 px на краю радиуса) не пересчитывается
 
 class Player:
-    def __init__(self, x, y, tile_width, tile_height, obstacles):
+    def __init__(self, x, y, tile_width, tile_height, obstacles, walls=None):
         self.x = x
         self.y = y
         self.tile_width = tile_width
         self.tile_height = tile_height
         self.obstacles = obstacles
+        self.walls = walls  # WallSegments карты для FOV_BACKEND 'polygon' (строятся по obstacles, если не заданы)
         self.move_speed = 4
         self.fov_target_dx = 0
         self.fov_target_dy = 1
@@ -25,12 +44,15 @@ class Player:
         self.fade_speed = 15
         self.next_map_info = None
         self.menu_active = False
-        self.last_fov_poly = None
+        self.last_fov_poly = None  # полигон последнего кадра в экранных координатах
         self.lit_enemies = set()
+        self.world_fov_poly = None  # тот же полигон в мировых координатах (кэш)
+        self.world_lit_enemies = set()
         # Для оптимизации FOV
         self._last_fov_params = None
         self._fov_recalc_cooldown = 0
         self._FOV_RECALC_DELAY = 2  # не чаще 1 раза в 2 кадра
+        self.fov_backend = FOV_BACKEND
         
         # Audio manager
         self.audio_manager = get_audio_manager()
@@ -49,15 +71,7 @@ class Player:
         return pygame.Rect(self.x, self.y, self.tile_width, self.tile_height)
 
     def is_colliding(self, px, py):
-        left = int(px / self.tile_width)
-        right = int((px + self.tile_width - 1) / self.tile_width)
-        top = int(py / self.tile_height)
-        bottom = int((py + self.tile_height - 1) / self.tile_height)
-        for tx in range(left, right + 1):
-            for ty in range(top, bottom + 1):
-                if (tx, ty) in self.obstacles:
-                    return True
-        return False
+        return self.obstacles.area_blocked(px, py, self.tile_width, self.tile_height)
 
     def update(self, cam_x=0, cam_y=0):
         # Переключение фонарика
@@ -116,30 +130,46 @@ class Player:
                     self.step_cooldown -= 1
 
     def _compute_fov_polygon(self, cam_x, cam_y, obstacles, tile_width, tile_height, angle=None, enemies=None):
+        # Полигон считается и кэшируется в мировых координатах, здесь он только сдвигается на камеру:
+        # плавное движение камеры не сбрасывает кэш
+        world_points, lit_enemies = self._compute_world_fov_polygon(obstacles, tile_width, tile_height, angle, enemies)
+        if world_points is None:
+            self.last_fov_poly = None
+            self.lit_enemies = set()
+            return None, set()
+        points = [(int(x - cam_x), int(y - cam_y)) for x, y in world_points]
+        self.last_fov_poly = points
+        self.lit_enemies = lit_enemies
+        return points, lit_enemies
+
+    def _compute_world_fov_polygon(self, obstacles, tile_width, tile_height, angle=None, enemies=None):
+        """
+        FOV polygon in world coordinates and the set of lit enemies, cached by player position,
+        flashlight direction and enemy positions (not by the camera).
+        """
         # Более агрессивная оптимизация: пересчёт только при существенном изменении
         player_pos = (int(self.x), int(self.y))
         dir_angle = math.degrees(math.atan2(self.fov_target_dy, self.fov_target_dx)) if (self.fov_target_dx or self.fov_target_dy) else 90
         last_params = self._last_fov_params
-        # num_steps уменьшен
-        num_steps = 40
-        # Проверяем, изменилось ли положение игрока или направление больше чем на 5 градусов
+        enemies_key = tuple(sorted((e.x, e.y) for e in enemies)) if enemies else None
+        # Проверяем, изменилось ли положение игрока или направление больше чем на FOV_ANGLE_THRESHOLD градусов.
+        # Пакетный расчёт и полигон достаточно дешёвые, чтобы пересчитывать при любом повороте (свет не отстаёт от мыши)
+        throttled = self.fov_backend == 'dda'
         need_recalc = True
         if last_params is not None:
-            last_pos, last_angle, last_cam, last_enemies = last_params
+            last_pos, last_angle, last_enemies = last_params
             angle_diff = abs((dir_angle - last_angle + 180) % 360 - 180)
-            if player_pos == last_pos and angle_diff < 5 and cam_x == last_cam[0] and cam_y == last_cam[1] and last_enemies == (tuple(sorted((e.x, e.y) for e in enemies)) if enemies else None):
-                if self._fov_recalc_cooldown > 0 and self.last_fov_poly is not None:
+            angle_same = angle_diff < (FOV_ANGLE_THRESHOLD if throttled else FOV_ANGLE_EPSILON)
+            if player_pos == last_pos and angle_same and last_enemies == enemies_key:
+                if throttled and self._fov_recalc_cooldown > 0 and self.world_fov_poly is not None:
                     self._fov_recalc_cooldown -= 1
-                    return self.last_fov_poly, self.lit_enemies
+                    return self.world_fov_poly, self.world_lit_enemies
                 need_recalc = False
         if not need_recalc:
-            return self.last_fov_poly, self.lit_enemies
+            return self.world_fov_poly, self.world_lit_enemies
         # Пересчитываем FOV
-        FOV_ANGLE = 100
-        FOV_RADIUS = 400
-        EXTRA_LIGHT_TILES = 1
-        player_cx = int(self.x - cam_x + tile_width // 2)
-        player_cy = int(self.y - cam_y + tile_height // 2)
+        origin_x = int(self.x + tile_width // 2)
+        origin_y = int(self.y + tile_height // 2)
         dx = self.fov_target_dx
         dy = self.fov_target_dy
         if angle is not None:
@@ -148,66 +178,70 @@ class Player:
         if dx == 0 and dy == 0:
             dx, dy = 0, 1
         angle_rad = math.atan2(dy, dx)
-        points = [(player_cx, player_cy)]
+        fov_rad = math.radians(FOV_ANGLE)
+        points = [(origin_x, origin_y)]
         lit_enemies = set()
-        for i in range(num_steps + 1):
-            a = angle_rad - math.radians(FOV_ANGLE) / 2 + i * math.radians(FOV_ANGLE) / num_steps
-            hit = False
-            enemy_hit = None
-            for r in range(0, FOV_RADIUS, 4):
-                x = player_cx + r * math.cos(a)
-                y = player_cy + r * math.sin(a)
-                tile_x = int((x + cam_x) // tile_width)
-                tile_y = int((y + cam_y) // tile_height)
-                if (tile_x, tile_y) in obstacles:
-                    hit = True
-                    break
-                if enemies:
-                    for enemy in enemies:
-                        if enemy.get_hitbox().collidepoint(x + cam_x, y + cam_y):
-                            hit = True
-                            enemy_hit = enemy
-                            break
-                    if hit:
-                        break
-            if hit:
-                r += tile_width * EXTRA_LIGHT_TILES
-                if r > FOV_RADIUS:
-                    r = FOV_RADIUS
-                x = player_cx + r * math.cos(a)
-                y = player_cy + r * math.sin(a)
-                if enemy_hit:
-                    lit_enemies.add(enemy_hit)
+        # Хитбоксы врагов один раз на пересчёт: (враг, left, top, right, bottom)
+        enemy_boxes = []
+        for enemy in enemies or ():
+            box = enemy.get_hitbox()
+            enemy_boxes.append((enemy, box.left, box.top, box.right, box.bottom))
+        if self.fov_backend == 'polygon':
+            if self.walls is None:
+                self.walls = WallSegments(obstacles, tile_width, tile_height)
+            boxes = [box[1:] for box in enemy_boxes]
+            angles, distances, hit_by = visibility_sweep(self.walls, origin_x, origin_y, angle_rad - fov_rad / 2, fov_rad,
+                                                         FOV_RADIUS, boxes)
+            for a, r, who in zip(angles.tolist(), distances.tolist(), hit_by.tolist()):
+                if who >= 0:
+                    lit_enemies.add(enemy_boxes[who][0])
+                if who != HIT_NONE:
+                    r = min(r + tile_width * EXTRA_LIGHT_TILES, FOV_RADIUS)
+                points.append((origin_x + r * math.cos(a), origin_y + r * math.sin(a)))
+        else:
+            angles = [angle_rad - fov_rad / 2 + i * fov_rad / FOV_RAYS for i in range(FOV_RAYS + 1)]
+            if self.fov_backend == 'numpy':
+                distances, hits = cast_rays_batch(obstacles, origin_x, origin_y, angles, FOV_RADIUS, tile_width, tile_height)
+                casts = zip(distances.tolist(), hits.tolist())
             else:
-                r = FOV_RADIUS
-                x = player_cx + r * math.cos(a)
-                y = player_cy + r * math.sin(a)
-            points.append((x, y))
-        self._last_fov_params = (player_pos, dir_angle, (cam_x, cam_y), tuple(sorted((e.x, e.y) for e in enemies)) if enemies else None)
+                casts = (cast_ray(obstacles, origin_x, origin_y, math.cos(a), math.sin(a), FOV_RADIUS, tile_width, tile_height)
+                         for a in angles)
+            for a, (r, hit) in zip(angles, casts):
+                cos_a = math.cos(a)
+                sin_a = math.sin(a)
+                if enemy_boxes:
+                    enemy_hit, enemy_r = self._first_enemy_on_ray(enemy_boxes, origin_x, origin_y, cos_a, sin_a, r)
+                    if enemy_hit:
+                        lit_enemies.add(enemy_hit)
+                        r, hit = enemy_r, True
+                if hit:
+                    r = min(r + tile_width * EXTRA_LIGHT_TILES, FOV_RADIUS)
+                points.append((origin_x + r * cos_a, origin_y + r * sin_a))
+        self._last_fov_params = (player_pos, dir_angle, enemies_key)
         self._fov_recalc_cooldown = self._FOV_RECALC_DELAY
-        
-        # Проверяем валидность точек перед сохранением
-        if points and len(points) > 2:
-            # Проверяем, что все точки - это пары чисел
-            valid_points = []
-            for point in points:
-                if isinstance(point, (tuple, list)) and len(point) == 2:
-                    x, y = point
-                    if isinstance(x, (int, float)) and isinstance(y, (int, float)):
-                        valid_points.append((int(x), int(y)))
-            
-            if len(valid_points) > 2:
-                self.last_fov_poly = valid_points
-                self.lit_enemies = lit_enemies
-                return valid_points, lit_enemies
-        
-        # Если точки невалидны, возвращаем None
-        self.last_fov_poly = None
-        self.lit_enemies = set()
-        return None, set()
+        if len(points) > 2:
+            self.world_fov_poly = points
+            self.world_lit_enemies = lit_enemies
+        else:
+            self.world_fov_poly = None
+            self.world_lit_enemies = set()
+        return self.world_fov_poly, self.world_lit_enemies
 
-    def draw_light(self, surface, cam_x, cam_y, obstacles, tile_width, tile_height, darkness_enabled, enemies=None):
-        # Отрисовка фонарика/FOV и затемнения
+    @staticmethod
+    def _first_enemy_on_ray(enemy_boxes, origin_x, origin_y, cos_a, sin_a, max_r):
+        """Nearest enemy whose box the ray enters before max_r (the wall distance): (enemy, r) or (None, max_r)."""
+        nearest = None
+        nearest_r = max_r
+        for enemy, left, top, right, bottom in enemy_boxes:
+            r = ray_box_distance(origin_x, origin_y, cos_a, sin_a, left, top, right, bottom)
+            if r is not None and r < nearest_r:
+                nearest = enemy
+                nearest_r = r
+        return nearest, nearest_r
+
+    def draw_light(self, surface, cam_x, cam_y, obstacles, tile_width, tile_height, darkness_enabled, enemies=None,
+                   static_lightmap=None):
+        # Отрисовка фонарика/FOV и затемнения (static_lightmap — запечённый свет карты, см. lighting.bake_static_lightmap)
         import math
         INTERNAL_WIDTH = 1024
         INTERNAL_HEIGHT = 1024
@@ -218,8 +252,6 @@ class Player:
         if self.flashlight_enabled:
             # Фонарик: сектор обзора (raycasting)
             FOV_ALPHA = 128  # уровень прозрачности сектора (0-255)
-            fov_mask = pygame.Surface((INTERNAL_WIDTH, INTERNAL_HEIGHT), pygame.SRCALPHA)
-            fov_mask.fill((0, 0, 0, FOV_ALPHA))
             points, lit_enemies = self._compute_fov_polygon(cam_x, cam_y, obstacles, tile_width, tile_height, enemies=enemies)
             
             # Проверяем валидность точек
@@ -237,9 +269,9 @@ class Player:
                     self.lit_enemies = lit_enemies
                     player_cx = int(self.x - cam_x + tile_width // 2)
                     player_cy = int(self.y - cam_y + tile_height // 2)
-                    pygame.draw.polygon(fov_mask, (0, 0, 0, 0), valid_points)
-                    # Также делаем светлый круг вокруг игрока
-                    pygame.draw.circle(fov_mask, (0, 0, 0, 0), (player_cx, player_cy), PLAYER_LIGHT_RADIUS)
+                    # Сектор и светлый круг вокруг игрока вырезаются в постоянной маске
+                    fov_mask = get_light_compositor((INTERNAL_WIDTH, INTERNAL_HEIGHT)).render(
+                        FOV_ALPHA, valid_points, ((player_cx, player_cy), PLAYER_LIGHT_RADIUS), static_lightmap, (cam_x, cam_y))
                     surface.blit(fov_mask, (0, 0))
                 else:
                     # Если точки невалидны, сбрасываем кэш
@@ -251,11 +283,11 @@ class Player:
                 self._last_fov_params = None
         else:
             # Просто светлый круг вокруг игрока
-            darkness_mask = pygame.Surface((INTERNAL_WIDTH, INTERNAL_HEIGHT), pygame.SRCALPHA)
-            darkness_mask.fill((0, 0, 0, DARK_ALPHA))
             player_cx = int(self.x - cam_x + tile_width // 2)
             player_cy = int(self.y - cam_y + tile_height // 2)
-            pygame.draw.circle(darkness_mask, (0, 0, 0, 0), (player_cx, player_cy), PLAYER_LIGHT_RADIUS)
+            darkness_mask = get_light_compositor((INTERNAL_WIDTH, INTERNAL_HEIGHT)).render(
+                DARK_ALPHA, circle=((player_cx, player_cy), PLAYER_LIGHT_RADIUS), static_lightmap=static_lightmap,
+                offset=(cam_x, cam_y))
             surface.blit(darkness_mask, (0, 0))
             self.last_fov_poly = None  # Нет сектора — нет полигона
             self.lit_enemies = set()
@@ -278,7 +310,11 @@ class Player:
         )
        # pygame.draw.rect(surface, (255, 0, 0), hitbox_rect, 2)
         # Нарисовать анимацию игрока
+        surface.blit(*self.get_blit(cam_x, cam_y, player_anim))
+
+    def get_blit(self, cam_x, cam_y, player_anim):
+        """(image, dest, area) tuple of the player's animation frame, for Surface.blits"""
         px = self.x - cam_x
         py = self.y - cam_y
-        player_anim.draw(surface, px, py - 32)
+        return player_anim.get_blit(px, py - 32)
 
@@ -0,0 +1,124 @@
+import math
+import numpy as np
+from occupancy import BLOCKED
+
+def cast_ray(grid, origin_x, origin_y, dir_x, dir_y, max_dist, tile_width, tile_height):
+    """
+    Exact grid traversal (DDA): walks the tiles a ray crosses, each exactly once,
+    until the first blocked tile of the OccupancyGrid.
+    origin — world pixels, (dir_x, dir_y) — unit direction.
+    Returns (distance, hit): the distance in pixels to the boundary of the first blocked tile,
+    or (max_dist, False) if nothing is hit within max_dist.
+    """
+    cells = grid.cells
+    width = grid.width
+    height = grid.height
+    outside_blocked = grid.outside_blocked
+    tx = int(origin_x // tile_width)
+    ty = int(origin_y // tile_height)
+
+    def blocked(tx, ty):
+        if 0 <= tx < width and 0 <= ty < height:
+            return cells[ty * width + tx] & BLOCKED
+        return outside_blocked
+
+    if blocked(tx, ty):
+        return 0.0, True
+    # Расстояние до первой вертикальной/горизонтальной границы тайла и шаг между границами
+    if dir_x > 0:
+        step_x = 1
+        t_max_x = ((tx + 1) * tile_width - origin_x) / dir_x
+        t_delta_x = tile_width / dir_x
+    elif dir_x < 0:
+        step_x = -1
+        t_max_x = (tx * tile_width - origin_x) / dir_x
+        t_delta_x = -tile_width / dir_x
+    else:
+        step_x = 0
+        t_max_x = t_delta_x = math.inf
+    if dir_y > 0:
+        step_y = 1
+        t_max_y = ((ty + 1) * tile_height - origin_y) / dir_y
+        t_delta_y = tile_height / dir_y
+    elif dir_y < 0:
+        step_y = -1
+        t_max_y = (ty * tile_height - origin_y) / dir_y
+        t_delta_y = -tile_height / dir_y
+    else:
+        step_y = 0
+        t_max_y = t_delta_y = math.inf
+    while True:
+        if t_max_x < t_max_y:
+            t = t_max_x
+            tx += step_x
+            t_max_x += t_delta_x
+        else:
+            t = t_max_y
+            ty += step_y
+            t_max_y += t_delta_y
+        if t >= max_dist:
+            return max_dist, False
+        if blocked(tx, ty):
+            return t, True
+
+def ray_box_distance(origin_x, origin_y, dir_x, dir_y, left, top, right, bottom):
+    """
+    Ray vs axis-aligned box (slab test). Returns the distance along the ray at which it enters
+    the box (0 if the origin is inside), or None if the ray misses it.
+    """
+    t_near = -math.inf
+    t_far = math.inf
+    for origin, d, low, high in ((origin_x, dir_x, left, right), (origin_y, dir_y, top, bottom)):
+        if d == 0:
+            # параллельно слою: либо всегда внутри, либо никогда
+            if origin < low or origin > high:
+                return None
+            continue
+        t1 = (low - origin) / d
+        t2 = (high - origin) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_near:
+            t_near = t1
+        if t2 < t_far:
+            t_far = t2
+        if t_near > t_far:
+            return None
+    if t_far < 0:
+        return None
+    return max(t_near, 0.0)
+
+def cast_rays_batch(grid, origin_x, origin_y, angles, max_dist, tile_width, tile_height):
+    """
+    Casts all rays of a fan at once with numpy, with the same result as cast_ray for each ray.
+    Every ray is sampled at the radii where it crosses a vertical or a horizontal tile boundary
+    (the tile entered at each crossing is tested against the grid), and the first blocked crossing wins.
+    angles — array of ray angles in radians. Returns (distances, hits) arrays.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    cos_a = np.cos(angles)[:, None]
+    sin_a = np.sin(angles)[:, None]
+    tx = int(origin_x // tile_width)
+    ty = int(origin_y // tile_height)
+    if grid.is_blocked(tx, ty):
+        return np.zeros(len(angles)), np.ones(len(angles), dtype=bool)
+
+    def crossings(origin, start_tile, size, d):
+        # Радиусы пересечения границ тайлов по одной оси и номера тайлов, в которые входит луч
+        k = np.arange(int(max_dist // size) + 2)
+        step = np.where(d > 0, 1, -1)
+        boundary = np.where(d > 0, (start_tile + 1) * size, start_tile * size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (boundary - origin) / d + k * size / np.abs(d)
+        # Лучи, параллельные оси, её границ не пересекают
+        t = np.where((d != 0) & (t < max_dist), t, max_dist)
+        return t, start_tile + step * (k + 1)
+
+    t_x, tiles_x = crossings(origin_x, tx, tile_width, cos_a)
+    t_y, tiles_y = crossings(origin_y, ty, tile_height, sin_a)
+    # Тайл, в который луч входит на вертикальной границе: x известен, y — по точке пересечения (и наоборот)
+    blocked_x = grid.blocked_many(tiles_x, np.floor_divide(origin_y + t_x * sin_a, tile_height)) & (t_x < max_dist)
+    blocked_y = grid.blocked_many(np.floor_divide(origin_x + t_y * cos_a, tile_width), tiles_y) & (t_y < max_dist)
+    distances = np.minimum(np.where(blocked_x, t_x, max_dist).min(axis=1),
+                           np.where(blocked_y, t_y, max_dist).min(axis=1))
+    return distances, distances < max_dist
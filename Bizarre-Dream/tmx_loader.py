@@ -1,15 +1,37 @@
 import pytmx
 import pygame
+import numpy as np
 
-def load_tmx_map(filename):
+def ensure_display():
     """
-    Loads a Tiled TMX map file and returns the tmx_data object.
-    Ensures Pygame display is initialized before loading.
+    Ensures Pygame display is initialized, so that images can be converted.
     """
     if not pygame.display.get_init() or not pygame.display.get_surface():
         pygame.display.set_mode((1, 1))  # Минимальное окно для конвертации изображений
+
+def load_tmx_map(filename, headless=False):
+    """
+    Loads a Tiled TMX map file and returns the tmx_data object.
+    Ensures Pygame display is initialized before loading.
+    headless=True parses only geometry and metadata without touching the display,
+    tile images stay unloaded until load_tmx_images(tmx_data).
+    """
+    if headless:
+        return pytmx.TiledMap(filename)
+    ensure_display()
     return pytmx.util_pygame.load_pygame(filename)
 
+def load_tmx_images(tmx_data):
+    """
+    Loads and converts the tile images of a map loaded with headless=True (no-op otherwise).
+    Returns tmx_data.images.
+    """
+    if tmx_data.image_loader is not pytmx.util_pygame.pygame_image_loader:
+        ensure_display()
+        tmx_data.image_loader = pytmx.util_pygame.pygame_image_loader
+        tmx_data.reload_images()
+    return tmx_data.images
+
 def draw_tmx_map(screen, tmx_data, offset_x=0, offset_y=0):
     """
     Draws all visible tile layers of the TMX map to the given Pygame surface, with an optional offset.
@@ -21,6 +43,161 @@ def draw_tmx_map(screen, tmx_data, offset_x=0, offset_y=0):
                 if tile:
                     screen.blit(tile, (offset_x + x * tmx_data.tilewidth, offset_y + y * tmx_data.tileheight))
 
+def layer_gids_array(layer):
+    """
+    Returns the gids of a TiledTileLayer as a compact 2D numpy array indexed [y, x].
+    0 means an empty cell.
+    """
+    gids = np.array(layer.data, dtype=np.uint32)
+    if gids.size and gids.max() < 2 ** 16:
+        gids = gids.astype(np.uint16)
+    return gids
+
+def get_tile_layer_infos(tmx_data):
+    """
+    Returns a list of tile layers in draw order.
+    Each layer is a dict with keys: name, gids (2D array [y, x]), visible, dynamic.
+    Layers with the custom property 'dynamic' are not pre-baked by MapRenderCache.
+    """
+    layers = []
+    for layer in tmx_data.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            info = {
+                'name': layer.name,
+                'gids': layer_gids_array(layer),
+                'visible': bool(layer.visible),
+                'dynamic': bool(layer.properties.get('dynamic', False))
+            }
+            layers.append(info)
+    return layers
+
+def get_tile_layer_blits(gids, images, tile_width, tile_height, view_w, view_h, offset_x=0, offset_y=0,
+                         atlas=None, tile_rects=None):
+    """
+    Returns blit tuples for one tile layer, visiting only the rows and columns inside
+    the view (view_w x view_h) and skipping empty cells.
+    With atlas and tile_rects (rects indexed by gid) the tuples are (atlas, dest, area),
+    otherwise (tile image, dest) from images indexed by gid.
+    """
+    rows, cols = gids.shape
+    first_col = max(0, int(-offset_x) // tile_width)
+    first_row = max(0, int(-offset_y) // tile_height)
+    last_col = min(cols, int(view_w - offset_x - 1) // tile_width + 1)
+    last_row = min(rows, int(view_h - offset_y - 1) // tile_height + 1)
+    if first_col >= last_col or first_row >= last_row:
+        return []
+    window = gids[first_row:last_row, first_col:last_col]
+    ys, xs = np.nonzero(window)
+    blits = []
+    for y, x, gid in zip((ys + first_row).tolist(), (xs + first_col).tolist(), window[ys, xs].tolist()):
+        dest = (offset_x + x * tile_width, offset_y + y * tile_height)
+        if atlas is not None:
+            area = tile_rects[gid]
+            if area:
+                blits.append((atlas, dest, area))
+        else:
+            tile = images[gid]
+            if tile:
+                blits.append((tile, dest))
+    return blits
+
+def draw_tile_layer_culled(surface, gids, images, tile_width, tile_height, offset_x=0, offset_y=0):
+    """
+    Draws one tile layer, visiting only the rows and columns inside the surface and skipping empty cells.
+    images — list of tile images indexed by gid (tmx_data.images).
+    """
+    view_w, view_h = surface.get_size()
+    blits = get_tile_layer_blits(gids, images, tile_width, tile_height, view_w, view_h, offset_x, offset_y)
+    surface.blits(blits, doreturn=False)
+
+class MapRenderCache:
+    """
+    Pre-baked render of the map's static tile layers.
+    Consecutive static layers are drawn once into fixed-size chunk surfaces,
+    draw() then blits only the chunks that intersect the target surface.
+    Layers marked 'dynamic' are drawn every frame from the tile atlas (or from images).
+    layers — list from get_tile_layer_infos, images — tile images indexed by gid,
+    atlas/tile_rects — optional tile atlas surface and per-gid rects inside it.
+    """
+    CHUNK_TILES = 8  # размер чанка в тайлах (8x8 тайлов = 256x256 px при тайле 32)
+
+    def __init__(self, layers, images, width, height, tile_width, tile_height, chunk_tiles=CHUNK_TILES,
+                 atlas=None, tile_rects=None):
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.images = images
+        self.atlas = atlas
+        self.tile_rects = tile_rects
+        self.chunk_tiles = chunk_tiles
+        self.chunk_width = chunk_tiles * self.tile_width
+        self.chunk_height = chunk_tiles * self.tile_height
+        self.cols = (width + chunk_tiles - 1) // chunk_tiles
+        self.rows = (height + chunk_tiles - 1) // chunk_tiles
+        self.layers = layers
+        # Проходы отрисовки по порядку слоёв: ('chunks', {(col, row): Surface}) или ('layer', layer_info)
+        self.passes = []
+        self.bake()
+
+    def bake(self):
+        """Draws runs of visible static layers into chunk surfaces, keeping the layer order."""
+        self.passes = []
+        chunks = None
+        for layer in self.layers:
+            if not layer['visible']:
+                continue
+            if layer['dynamic']:
+                self.passes.append(('layer', layer))
+                chunks = None
+                continue
+            if chunks is None:
+                chunks = {}
+                self.passes.append(('chunks', chunks))
+            self._bake_layer(layer['gids'], chunks)
+
+    def _bake_layer(self, gids, chunks):
+        ys, xs = np.nonzero(gids)
+        for y, x, gid in zip(ys.tolist(), xs.tolist(), gids[ys, xs].tolist()):
+            tile = self.images[gid]
+            if not tile:
+                continue
+            key = (x // self.chunk_tiles, y // self.chunk_tiles)
+            chunk = chunks.get(key)
+            if chunk is None:
+                # пустые чанки не создаются
+                chunk = pygame.Surface((self.chunk_width, self.chunk_height), pygame.SRCALPHA)
+                chunks[key] = chunk
+            chunk.blit(tile, ((x % self.chunk_tiles) * self.tile_width, (y % self.chunk_tiles) * self.tile_height))
+
+    def get_blits(self, view_w, view_h, offset_x=0, offset_y=0):
+        """
+        Returns the blit tuples for the part of the map visible in a view_w x view_h surface,
+        with the same offset semantics as draw_tmx_map.
+        """
+        # Диапазон чанков, попадающих в видимую область
+        first_col = max(0, int(-offset_x) // self.chunk_width)
+        first_row = max(0, int(-offset_y) // self.chunk_height)
+        last_col = min(self.cols - 1, int(view_w - offset_x - 1) // self.chunk_width)
+        last_row = min(self.rows - 1, int(view_h - offset_y - 1) // self.chunk_height)
+        blits = []
+        for kind, data in self.passes:
+            if kind == 'layer':
+                blits.extend(get_tile_layer_blits(data['gids'], self.images, self.tile_width, self.tile_height,
+                                                  view_w, view_h, offset_x, offset_y, self.atlas, self.tile_rects))
+                continue
+            for row in range(first_row, last_row + 1):
+                for col in range(first_col, last_col + 1):
+                    chunk = data.get((col, row))
+                    if chunk is not None:
+                        blits.append((chunk, (offset_x + col * self.chunk_width, offset_y + row * self.chunk_height)))
+        return blits
+
+    def draw(self, surface, offset_x=0, offset_y=0):
+        """
+        Draws the map visible on the given surface, with the same offset semantics as draw_tmx_map.
+        """
+        view_w, view_h = surface.get_size()
+        surface.blits(self.get_blits(view_w, view_h, offset_x, offset_y), doreturn=False)
+
 def get_collision_rects(tmx_data):
     """
     Returns a list of pygame.Rect for all objects in the first object layer (collision layer).
@@ -81,4 +258,19 @@ def get_enemy_infos(tmx_data):
                 }
                 enemies.append(info)
             break
-    return enemies
\ No newline at end of file
+    return enemies
+
+def build_obstacle_set(collision_rects, tile_width, tile_height):
+    """
+    Returns the set of (tx, ty) tiles covered by the collision rects.
+    """
+    obstacles = set()
+    for rect in collision_rects:
+        left = rect.left // tile_width
+        right = (rect.right - 1) // tile_width
+        top = rect.top // tile_height
+        bottom = (rect.bottom - 1) // tile_height
+        for tx in range(left, right + 1):
+            for ty in range(top, bottom + 1):
+                obstacles.add((tx, ty))
+    return obstacles
@@ -0,0 +1,148 @@
+import math
+import numpy as np
+from occupancy import BLOCKED
+
+ARC_STEP = math.radians(2.5)  # шаг точек дуги там, где свет упирается в радиус, а не в стену
+ANGLE_EPSILON = 1e-4  # смещение лучей по обе стороны от угла стены, рад
+SIDE_RAY_TOLERANCE = 1.0  # луч сбоку от угла нужен, только если его дальность отличается от угла больше, px
+COLLINEAR_TOLERANCE = 1e-3  # вершина на стене ближе к прямой между соседями, px, — лишняя
+
+# Кто остановил луч (третий результат visibility_sweep)
+HIT_NONE = -2  # луч дошёл до радиуса
+HIT_WALL = -1  # стена; значения >= 0 — индекс прямоугольника из boxes
+
+class WallSegments:
+    """
+    Wall edges of the map merged into the fewest axis-aligned segments (world pixels).
+    An edge lies between a blocked and a free tile; tiles outside the map are blocked
+    when the grid says so, so the map border is a wall too.
+    Built once per map from the OccupancyGrid.
+    """
+    def __init__(self, grid, tile_width, tile_height):
+        self.grid = grid
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        blocked = np.full((grid.height + 2, grid.width + 2), grid.outside_blocked, dtype=bool)
+        blocked[1:-1, 1:-1] = (grid.array & BLOCKED) != 0
+        segments = []
+        # Горизонтальные рёбра: строка i — граница y = i * tile_height между рядами тайлов i-1 и i
+        horizontal = blocked[1:, 1:-1] != blocked[:-1, 1:-1]
+        for i, row in enumerate(horizontal):
+            y = i * tile_height
+            for start, end in self._runs(row):
+                segments.append((start * tile_width, y, end * tile_width, y))
+        # Вертикальные рёбра: столбец j — граница x = j * tile_width между столбцами тайлов j-1 и j
+        vertical = blocked[1:-1, 1:] != blocked[1:-1, :-1]
+        for j, column in enumerate(vertical.T):
+            x = j * tile_width
+            for start, end in self._runs(column):
+                segments.append((x, start * tile_height, x, end * tile_height))
+        self.segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+
+    @staticmethod
+    def _runs(mask):
+        """(start, end) of every run of True in a 1D bool array, end exclusive."""
+        padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(padded))
+        return zip(edges[::2].tolist(), edges[1::2].tolist())
+
+    def __len__(self):
+        return len(self.segments)
+
+    def near(self, x, y, radius):
+        """Segments whose bounding box intersects the square of the given radius around (x, y)."""
+        s = self.segments
+        mask = ((np.minimum(s[:, 0], s[:, 2]) <= x + radius) & (np.maximum(s[:, 0], s[:, 2]) >= x - radius) &
+                (np.minimum(s[:, 1], s[:, 3]) <= y + radius) & (np.maximum(s[:, 1], s[:, 3]) >= y - radius))
+        return s[mask]
+
+def box_segments(left, top, right, bottom):
+    """The four edges of a rectangle as segments."""
+    return [(left, top, right, top), (right, top, right, bottom),
+            (right, bottom, left, bottom), (left, bottom, left, top)]
+
+def visibility_sweep(walls, origin_x, origin_y, start_angle, fov, radius, boxes=()):
+    """
+    Exact visibility inside a cone (start_angle .. start_angle + fov, radians) limited by radius.
+    Rays are cast at every nearby wall corner (and just beside it), at the cone edges and along the arc
+    at ARC_STEP, all at once with numpy. Only the vertices that shape the polygon are returned:
+    side rays that land where the corner ray did, arc points stopped by a wall
+    and wall vertices collinear with their neighbours are dropped.
+    boxes — extra occluders (left, top, right, bottom), e.g. enemy hitboxes.
+    Returns (angles, distances, hit_by) sorted by angle; hit_by is HIT_NONE, HIT_WALL or a box index.
+    """
+    tile_x = int(origin_x // walls.tile_width)
+    tile_y = int(origin_y // walls.tile_height)
+    if walls.grid.is_blocked(tile_x, tile_y):
+        angles = np.array([start_angle, start_angle + fov])
+        return angles, np.zeros(2), np.full(2, HIT_WALL)
+    segments = walls.near(origin_x, origin_y, radius)
+    owners = np.full(len(segments), HIT_WALL)
+    if len(boxes):
+        box_segs = [seg for box in boxes for seg in box_segments(*box)]
+        segments = np.concatenate((segments, np.array(box_segs, dtype=np.float64)))
+        owners = np.concatenate((owners, np.repeat(np.arange(len(boxes)), 4)))
+    # Углы лучей: углы стен внутри конуса и радиуса (угол — конец и горизонтального, и вертикального отрезка),
+    # лучи по бокам от них, края конуса и дуга
+    points_x = np.concatenate((segments[:, 0], segments[:, 2]))
+    points_y = np.concatenate((segments[:, 1], segments[:, 3]))
+    near = np.hypot(points_x - origin_x, points_y - origin_y) <= radius
+    corner = np.unique(np.arctan2(points_y[near] - origin_y, points_x[near] - origin_x))
+    corner_rel = np.mod(corner - start_angle, 2 * math.pi)
+    corner_rel = corner_rel[corner_rel <= fov]
+    count = len(corner_rel)
+    arc_count = max(1, int(math.ceil(fov / ARC_STEP)))
+    arc = np.linspace(0.0, fov, arc_count + 1)
+    rel = np.concatenate((corner_rel, corner_rel - ANGLE_EPSILON, corner_rel + ANGLE_EPSILON, arc))
+    distances, hit_by = _cast(origin_x, origin_y, start_angle + rel, segments, owners, radius)
+    keep = np.ones(len(rel), dtype=bool)
+    # Луч сбоку от угла нужен, только если уходит дальше или ближе самого угла (угол — край тени)
+    side = slice(count, 3 * count)
+    keep[side] = ((np.abs(distances[side] - np.tile(distances[:count], 2)) > SIDE_RAY_TOLERANCE) &
+                  (rel[side] >= 0) & (rel[side] <= fov))
+    # Точки дуги, упёршиеся в стену, лежат на прямой между соседними углами — они не нужны
+    keep[3 * count:] = hit_by[3 * count:] == HIT_NONE
+    keep[3 * count] = keep[-1] = True  # края конуса
+    rel = rel[keep]
+    distances = distances[keep]
+    hit_by = hit_by[keep]
+    order = np.argsort(rel, kind='stable')
+    rel = rel[order]
+    distances = distances[order]
+    hit_by = hit_by[order]
+    # Вершины на стене, лежащие на прямой между соседями (несколько углов одной стены), не меняют многоугольник
+    if len(rel) > 2:
+        x = distances * np.cos(rel)
+        y = distances * np.sin(rel)
+        chord_x = x[2:] - x[:-2]
+        chord_y = y[2:] - y[:-2]
+        cross = (x[1:-1] - x[:-2]) * chord_y - (y[1:-1] - y[:-2]) * chord_x
+        collinear = np.abs(cross) <= COLLINEAR_TOLERANCE * np.hypot(chord_x, chord_y)
+        keep = np.ones(len(rel), dtype=bool)
+        keep[1:-1] = ~(collinear & (hit_by[1:-1] == HIT_WALL))
+        rel = rel[keep]
+        distances = distances[keep]
+        hit_by = hit_by[keep]
+    return start_angle + rel, distances, hit_by
+
+def _cast(origin_x, origin_y, angles, segments, owners, radius):
+    """Nearest segment hit by each ray: (distances clipped to radius, owners or HIT_NONE)."""
+    if not len(segments):
+        return np.full(len(angles), float(radius)), np.full(len(angles), HIT_NONE)
+    cos_a = np.cos(angles)[:, None]
+    sin_a = np.sin(angles)[:, None]
+    edge_x = (segments[:, 2] - segments[:, 0])[None, :]
+    edge_y = (segments[:, 3] - segments[:, 1])[None, :]
+    to_x = (segments[:, 0] - origin_x)[None, :]
+    to_y = (segments[:, 1] - origin_y)[None, :]
+    # origin + t * dir == start + u * edge
+    denom = cos_a * edge_y - sin_a * edge_x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (to_x * edge_y - to_y * edge_x) / denom
+        u = (to_x * sin_a - to_y * cos_a) / denom
+    valid = (denom != 0) & (t >= 0) & (u >= 0) & (u <= 1)
+    t = np.where(valid, t, np.inf)
+    nearest = t.argmin(axis=1)
+    distances = t[np.arange(len(angles)), nearest]
+    hit = distances < radius
+    return np.where(hit, distances, radius), np.where(hit, owners[nearest], HIT_NONE)